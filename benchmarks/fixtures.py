@@ -0,0 +1,197 @@
+"""
+SC2Pulse payloads the benchmarks replay.
+
+The committed fixtures are generated: they follow the schema of /character/search and
+/character/{id}/common (see modules/search_player.py), but every player, match and rating is made up.
+Regenerate them with `python -m benchmarks.fixtures`, or replace one with a real response using
+`python -m benchmarks.fixtures --record <size> <battletag>`.
+"""
+import argparse
+import datetime
+import gzip
+import json
+import os
+import random
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+# All generated matches happen before this, so results don't depend on when benchmarks run
+ANCHOR = datetime.datetime(2026, 10, 10, tzinfo=datetime.timezone.utc)
+
+# Size -> (character id, matches, days of history, linked characters, seed)
+SIZES = {
+    'small':        (1001, 12,   7,   1, 1),
+    'typical':      (1002, 120,  30,  2, 2),
+    'pathological': (1003, 2500, 180, 8, 3),
+}
+
+RACES = ['PROTOSS', 'TERRAN', 'ZERG', 'RANDOM']
+MAPS  = ['Alcyone LE', 'Amphion LE', 'Crimson Court LE', 'Dynasty LE', 'Ghost River LE', 'Goldenaura LE', 'Oceanborn LE', 'Post-Youth LE']
+
+def date_str(date: datetime.datetime) -> str:
+    return date.strftime('%Y-%m-%dT%H:%M:%S.') + f"{date.microsecond // 1000:03d}Z"
+
+def character(character_id: int, rnd: random.Random) -> dict:
+    tag           = f"Player{character_id}"
+    discriminator = 100 + character_id % 900
+    return {
+        'realm': 1, 'name': f"{tag}#{discriminator}", 'id': character_id, 'accountId': character_id * 10,
+        'region': 'US', 'battlenetId': rnd.randint(10**6, 10**7), 'tag': tag, 'discriminator': discriminator,
+    }
+
+def account(character_id: int) -> dict:
+    return {
+        'battleTag': f"Player{character_id}#{1000 + character_id}", 'id': character_id * 10, 'partition': 'GLOBAL',
+        'hidden': None, 'tag': f"Player{character_id}", 'discriminator': 1000 + character_id,
+    }
+
+def linked_character(character_id: int, rating: int, rnd: random.Random) -> dict:
+    race = rnd.choice(RACES[:3])
+    games = rnd.randint(50, 2000)
+    return {
+        'leagueMax': rnd.randint(3, 6), 'ratingMax': rating + rnd.randint(0, 400), 'totalGamesPlayed': games,
+        'previousStats': {'rating': rating - rnd.randint(-100, 100), 'gamesPlayed': rnd.randint(0, 100), 'rank': rnd.randint(1, 10**5)},
+        'currentStats': {'rating': rating, 'gamesPlayed': rnd.randint(0, 100), 'rank': rnd.randint(1, 10**5)},
+        'members': {
+            f"{race.lower()}GamesPlayed": games,
+            'character': character(character_id, rnd),
+            'account': account(character_id),
+            'clan': None,
+            'raceGames': {race: games},
+        },
+    }
+
+def team(members: list, rating, league: int, rnd: random.Random) -> dict:
+    return {
+        'rating': rating, 'wins': rnd.randint(0, 200), 'losses': rnd.randint(0, 200), 'ties': 0,
+        'id': rnd.randint(10**8, 10**9), 'legacyId': str(rnd.randint(10**8, 10**9)), 'divisionId': rnd.randint(1, 10**6),
+        'season': 60, 'region': 'US', 'league': {'type': league, 'queueType': 201, 'teamType': 0},
+        'tierType': rnd.randint(0, 2), 'members': members,
+    }
+
+def make_common(character_id: int, n_matches: int, days: int, n_linked: int, seed: int) -> dict:
+    """A /common response: n_matches over `days` days, newest first, with one history snapshot per match"""
+    rnd    = random.Random(seed)
+    rating = rnd.randint(2500, 4500)
+    linked = [linked_character(character_id, rating, rnd)]
+    linked += [linked_character(character_id + 10**6 * i, rnd.randint(2000, 4000), rnd) for i in range(1, n_linked)]
+    me     = {'character': {'id': character_id}, 'account': account(character_id)}
+    pathological = n_matches > 1000
+
+    matches = []
+    history = {key: [] for key in ('teamId', 'dateTime', 'rating', 'games', 'wins', 'leagueType', 'tier', 'queueType', 'season', 'race')}
+    step    = days * 24 * 60 * 60 / max(n_matches, 1)
+    for i in range(n_matches):
+        date     = ANCHOR - datetime.timedelta(seconds=step * i + rnd.randint(0, int(step) // 2))
+        won      = rnd.random() < 0.52
+        change   = rnd.randint(8, 32)
+        league   = max(0, min(6, (rating - 1500) // 500))
+        opponent = rnd.choice([None] + [rating + rnd.randint(-400, 400)] * 6)
+
+        my_team    = {'participant': {'matchId': i, 'playerCharacterId': character_id, 'teamId': 1, 'decision': 'WIN' if won else 'LOSS', 'ratingChange': rnd.choice([None, change, change, change])},
+                      'team': team([me], rating, league, rnd)}
+        their_team = {'participant': {'matchId': i, 'playerCharacterId': 99, 'teamId': 2, 'decision': 'LOSS' if won else 'WIN', 'ratingChange': change},
+                      'team': team([{'character': {'id': 99}}], opponent, league, rnd)}
+        participants = [my_team, their_team] if rnd.random() < 0.5 else [their_team, my_team]
+
+        # Pathological histories also have everything the parsers have to skip
+        if pathological and rnd.random() < 0.05:
+            participants = rnd.choice([[my_team], [my_team, their_team, their_team], [my_team, {'participant': {}, 'team': None}]])
+
+        matches.append({
+            'match': {'date': date_str(date), 'type': '_1V1' if not pathological or rnd.random() < 0.9 else '_2V2',
+                      'id': character_id * 10**5 + i, 'mapId': 1, 'region': 'US', 'updated': date_str(date), 'duration': rnd.randint(300, 2400)},
+            'map': {'id': 1, 'name': rnd.choice(MAPS)},
+            'participants': participants,
+        })
+
+        history['teamId'].append(rnd.randint(1, 4))
+        history['dateTime'].append(date_str(date))
+        history['rating'].append(rating)
+        history['games'].append(n_matches - i)
+        history['wins'].append(rnd.randint(0, n_matches - i))
+        history['leagueType'].append(league)
+        history['tier'].append(rnd.randint(0, 2))
+        history['queueType'].append(201 if not pathological or rnd.random() < 0.9 else rnd.choice([202, 203, None]))
+        history['season'].append(60)
+        history['race'].append(rnd.choice(RACES[:3]) if rnd.random() < 0.3 else RACES[seed % 3])
+
+        # Walk the rating back in time
+        rating -= change if won else -change
+
+    return {
+        'teams': [team([linked[0]['members']], rnd.randint(2000, 4500), rnd.randint(0, 6), rnd) for _ in range(n_linked * 4)],
+        'linkedDistinctCharacters': linked,
+        'stats': [{'stats': {'id': i, 'playerCharacterId': character_id, 'queueType': 201, 'teamType': 0, 'race': race, 'ratingMax': 4000, 'leagueMax': 5, 'gamesPlayed': 100},
+                   'previousStats': {'rating': None, 'gamesPlayed': None, 'rank': None},
+                   'currentStats': {'rating': 3000, 'gamesPlayed': 50, 'rank': 1000}} for i, race in enumerate(RACES[:3])],
+        'matches': matches,
+        'history': history,
+    }
+
+def make_search(seed: int = 0) -> list:
+    """A /character/search response: every fixture player, plus lookalikes that shouldn't win the search"""
+    rnd = random.Random(seed)
+    results = [linked_character(character_id, rnd.randint(2000, 4500), rnd) for character_id, *_ in SIZES.values()]
+    for i in range(40):
+        lookalike = linked_character(2000 + i, rnd.randint(1000, 5000), rnd)
+        lookalike['members']['character']['tag'] = f"Player{rnd.choice(list(SIZES.values()))[0]}{rnd.choice('xyz_')}"
+        results.append(lookalike)
+    rnd.shuffle(results)
+    return results
+
+def path(name: str) -> str:
+    return os.path.join(FIXTURE_DIR, f"{name}.json.gz")
+
+def save(name: str, payload):
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    # mtime=0 keeps regenerated files byte-identical
+    with open(path(name), 'wb') as f:
+        with gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as gz:
+            gz.write(json.dumps(payload, separators=(',', ':')).encode())
+
+def load_raw(name: str) -> bytes:
+    with gzip.open(path(name), 'rb') as f:
+        return f.read()
+
+def load(name: str):
+    return json.loads(load_raw(name))
+
+def load_index() -> dict:
+    """Returns {size: character id} for the common fixtures"""
+    with open(os.path.join(FIXTURE_DIR, 'index.json'), 'r') as f:
+        return json.load(f)
+
+def save_index(index: dict):
+    with open(os.path.join(FIXTURE_DIR, 'index.json'), 'w') as f:
+        json.dump(index, f, indent=4)
+
+def generate():
+    save('search', make_search())
+    for size, params in SIZES.items():
+        save(f"common_{size}", make_common(*params))
+    save_index({size: params[0] for size, params in SIZES.items()})
+
+def record(size: str, battle_tag: str):
+    """Replaces a fixture with live responses from SC2Pulse"""
+    import requests
+    api = "https://sc2pulse.nephest.com/sc2/api"
+    results = requests.get(f"{api}/character/search", params={'term': battle_tag}).json()
+    character_id = results[0]['members']['character']['id']
+    common = requests.get(f"{api}/character/{character_id}/common", params={'matchType': '_1V1', 'mmrHistoryDepth': 180}).json()
+    save('search', results)
+    save(f"common_{size}", common)
+    save_index({**load_index(), size: character_id})
+    print(f"Recorded {battle_tag} (character {character_id}) as common_{size}. Rerun the benchmarks with --update-golden")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--record', nargs=2, metavar=('SIZE', 'BATTLETAG'), help="record a live player as one of the fixture sizes")
+    args = parser.parse_args()
+
+    if args.record:
+        record(*args.record)
+    else:
+        generate()
+        for name in ['search', *(f"common_{size}" for size in SIZES)]:
+            print(f"{path(name)}: {os.path.getsize(path(name)) // 1024} KiB compressed, {len(load_raw(name)) // 1024} KiB raw")
@@ -0,0 +1,57 @@
+"""
+Scan channel messages for the BattleTag extraction benchmarks.
+
+Generated from a seed, like the fixtures: ordinary chat, roster posts listing a whole team,
+and noisy messages full of things that look like BattleTags but aren't (urls, colours, channels, issue numbers).
+"""
+import random
+import re
+
+# How bot.py used to find accounts, one per message, for comparison
+LEGACY_PATTERN = re.compile(r'\w+\s*#\d{1,9}')
+
+def legacy_match_account(content: str):
+    account = LEGACY_PATTERN.search(content)
+    return re.sub(r'\s', '', account.group(0)) if account else None
+
+NAMES = ['Maru', 'Serral', 'herO', 'Clem', 'Reynor', 'ByuN', 'Dark', 'Oliveira', 'Élazer', 'Søren', 'Škorpión', 'Ñandú', 'Жуков', '李晓峰', 'さくら', 'PiG', 'Harstem', 'uThermal']
+WORDS = ['gg', 'anyone', 'up', 'for', 'customs', 'tonight', 'ladder', 'is', 'rough', 'this', 'season', 'my', 'add', 'me', 'zerg', 'terran', 'protoss', 'practice', 'build', 'order', 'ty']
+NOISE = [
+    'https://sc2pulse.nephest.com/sc2/?type=character&id=315071#player-stats-mmr',
+    'colour #ff8800 looks better', 'see #general', 'fixed in #1234', 'C# 12 ftw', 'ranked #3',
+    'top #10000', 'Supercalifragilistic#1234', '1v1#2345', 'x#12345',
+]
+
+def battletag(rnd: random.Random) -> str:
+    name = rnd.choice(NAMES) + (str(rnd.randint(1, 99)) if rnd.random() < 0.3 else '')
+    code = rnd.randint(1000, 99999) if rnd.random() < 0.8 else rnd.randint(100, 999)
+    return f"{name}{rnd.choice(['', '', '', ' '])}#{code}"
+
+def chat(rnd: random.Random) -> str:
+    words = rnd.choices(WORDS, k=rnd.randint(3, 20))
+    if rnd.random() < 0.15:
+        words.insert(rnd.randint(0, len(words)), battletag(rnd))
+    return ' '.join(words)
+
+def roster(rnd: random.Random) -> str:
+    lines = ['Team roster:'] + [f"{i + 1}. {battletag(rnd)} ({rnd.choice(['Z', 'T', 'P'])})" for i in range(rnd.randint(5, 15))]
+    return '\n'.join(lines)
+
+def noisy(rnd: random.Random) -> str:
+    parts = rnd.choices(NOISE, k=rnd.randint(1, 4)) + rnd.choices(WORDS, k=rnd.randint(0, 8))
+    if rnd.random() < 0.3:
+        parts.append(battletag(rnd))
+    rnd.shuffle(parts)
+    return ' '.join(parts)
+
+# Corpus -> (message generator, messages)
+CORPORA = {
+    'chat':   (chat,   5000),
+    'roster': (roster, 500),
+    'noisy':  (noisy,  2000),
+}
+
+def corpus(name: str, seed: int = 25) -> list:
+    make, count = CORPORA[name]
+    rnd = random.Random(f"{name}-{seed}")
+    return [make(rnd) for _ in range(count)]
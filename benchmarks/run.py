@@ -0,0 +1,203 @@
+"""
+Offline benchmarks for the fetch -> parse -> score -> select pipeline, and for finding BattleTags in scanned messages.
+
+Runs against the stub server and fixtures in this directory, never the live SC2Pulse API,
+and checks every stage still produces the outputs recorded in benchmarks/golden.json.
+Facts are also checked against the original, unoptimized parsers in benchmarks/reference.py,
+so the run fails if an optimization changed what facts are found.
+
+    python -m benchmarks.run                    # benchmark and check golden outputs
+    python -m benchmarks.run --only parse       # just the benchmarks with 'parse' in their name
+    python -m benchmarks.run --update-golden    # after an intended change in output
+"""
+import argparse
+import copy
+import dataclasses
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT   = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden.json')
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import fixtures, messages, reference
+from benchmarks.stub_server import StubServer
+
+# Written to a scratch directory, since modules.config reads ./config.yml on import
+BENCH_CONFIG = """
+Token: benchmark
+API URL: {url}
+Requests Per Second: 100000
+Request Burst: 100000
+Cache Directory: null
+"""
+
+def use_stub_config(url: str) -> str:
+    """Switches to a scratch directory whose config.yml points the client at the stub. Must run before importing modules"""
+    directory = tempfile.mkdtemp(prefix='sc2bench-')
+    with open(os.path.join(directory, 'config.yml'), 'w') as f:
+        f.write(BENCH_CONFIG.format(url=url))
+    os.chdir(directory)
+    return directory
+
+def measure(function, repeat: int) -> list:
+    """Runs function `repeat` times, returning each run's duration in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+def fact_summary(facts) -> list:
+    return [[type(fact).__name__, str(fact), round(fact.impressive(), 9)] for fact in facts]
+
+def digest(items) -> list:
+    """[count, sha256] of a long output, so golden.json stays readable"""
+    items = [json.dumps(item, ensure_ascii=False) for item in items]
+    return [len(items), hashlib.sha256('\n'.join(items).encode()).hexdigest()]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.02, help="stub server latency per request, in seconds")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per benchmark")
+    parser.add_argument('--only', default='', help="only run benchmarks whose name contains this")
+    parser.add_argument('--update-golden', action='store_true', help="record the current outputs as golden")
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency).start()
+    scratch = use_stub_config(stub.url)
+    try:
+        return run_benchmarks(args)
+    finally:
+        stub.stop()
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+def run_benchmarks(args) -> int:
+    """Builds every benchmark, runs them, and checks the golden outputs. Returns the exit code"""
+    from modules import search_player
+    from modules.parse_facts import parse_player_matches, parse_player_history, extract_facts, find_linked_player
+    from modules.match_record import match_records
+    from modules.select_facts import select_facts
+    from modules.batch_scoring import score_factoids
+    from modules.factoids import smoid_scaling
+    from modules.battletags import find_battletags, BattleTagIndex
+
+    index   = fixtures.load_index()
+    commons = {size: fixtures.load(f"common_{size}") for size in index}
+    players = {size: find_linked_player(commons[size], character_id) for size, character_id in index.items()}
+    records = {size: match_records(commons[size]['matches'], index[size]) for size in index}
+
+    # Reporting windows: the last week of each fixture, as a weekly post would use, and everything
+    cutoffs = dict()
+    for size in index:
+        newest = max(record.date for record in records[size])
+        cutoffs[f"{size}/week"] = (size, newest - datetime.timedelta(days=7))
+        cutoffs[f"{size}/all"]  = (size, datetime.datetime(year=1, month=1, day=1, tzinfo=datetime.timezone.utc))
+
+    golden = dict()
+    benchmarks = dict()
+    failures = []
+
+    # Fetching, through the stub server with caching bypassed
+    def fetch_search(size):
+        term = players[size]['members']['account']['battleTag']
+        def run():
+            search_player.SEARCH_CACHE.clear()
+            return search_player.search_player(term)
+        golden[f"search/{size}"] = run()['members']['character']['id']
+        return run
+    def fetch_history(size):
+        def run():
+            search_player.HISTORY_CACHE.clear()
+            return search_player.get_player_history(index[size])
+        golden[f"history/{size}"] = {key: len(value) for key, value in sorted(run().items())}
+        return run
+    for size in index:
+        benchmarks[f"search_player/{size}"] = fetch_search(size)
+        benchmarks[f"get_player_history/{size}"] = fetch_history(size)
+
+    # Parsing, straight from the fixtures
+    for size in index:
+        benchmarks[f"match_records/{size}"] = lambda size=size: match_records(commons[size]['matches'], index[size])
+    for name, (size, cutoff) in cutoffs.items():
+        matches = lambda size=size, cutoff=cutoff: list(parse_player_matches(players[size], records[size], cutoff))
+        history = lambda size=size, cutoff=cutoff: list(parse_player_history(players[size], commons[size], cutoff))
+        benchmarks[f"parse_player_matches/{name}"] = matches
+        benchmarks[f"parse_player_history/{name}"] = history
+        facts = fact_summary(extract_facts(players[size], {**commons[size], 'matches': records[size]}, cutoff))
+        golden[f"facts/{name}"] = facts if name.endswith('/week') else digest(facts)
+
+    # The original parsers, on a raw copy of each fixture, must find exactly the same facts
+    for size in index:
+        newest = max(record.date for record in records[size])
+        for days in (7, 30, None):
+            cutoff = newest - datetime.timedelta(days=days) if days else datetime.datetime(year=1, month=1, day=1, tzinfo=datetime.timezone.utc)
+            facts    = extract_facts(players[size], {**commons[size], 'matches': records[size]}, cutoff)
+            expected = reference.extract_facts(players[size], copy.deepcopy(commons[size]), cutoff)
+            if facts != expected or fact_summary(facts) != fact_summary(expected):
+                failures.append(f"Facts for {size} ({f'last {days} days' if days else 'all time'}) differ from the original parsers")
+        benchmarks[f"reference_parse/{size}"] = lambda size=size: reference.extract_facts(players[size], copy.deepcopy(commons[size]), cutoffs[f"{size}/all"][1])
+
+    # Scoring: one fact at a time, as factoids do on creation, vs one numpy pass per factoid type
+    # The batch scores have to match the factoids' own, or the run fails
+    all_facts = [fact for name, (size, cutoff) in cutoffs.items() for fact in extract_facts(players[size], {**commons[size], 'matches': records[size]}, cutoff)]
+    benchmarks['score_factoids/scalar'] = lambda: [fact.interest * smoid_scaling(fact.calc_impressive()) for fact in all_facts]
+    benchmarks['score_factoids/batch']  = lambda: score_factoids(all_facts)
+    batch = score_factoids(all_facts)
+    worst = max((abs(b - f.impressive()) / max(abs(f.impressive()), 1e-12) for b, f in zip(batch, all_facts)), default=0)
+    if worst > 1e-9:
+        failures.append(f"Batch scores differ from factoid scores by up to {worst:.2e} (relative)")
+
+    # post_weekly's selection step, for a server with 200 players
+    server_facts = [dataclasses.replace(fact, player_id=fact.player_id * 1000 + copy) for copy in range(200 // len(cutoffs) + 1) for fact in all_facts]
+    benchmarks['select_facts/200_players'] = lambda: select_facts(server_facts, count=6)
+    golden['select_facts/200_players'] = [[fact.player_id, str(fact)] for fact in select_facts(server_facts, count=6)]
+
+    # Scanning: every BattleTag in a channel's messages, deduplicated, vs the old first-match-per-message regex
+    for corpus in messages.CORPORA:
+        texts = messages.corpus(corpus)
+        def scan(texts=texts):
+            known = BattleTagIndex()
+            return {known.canonical(tag) for text in texts for tag in find_battletags(text)}
+        benchmarks[f"find_battletags/{corpus}"] = scan
+        benchmarks[f"legacy_match_account/{corpus}"] = lambda texts=texts: {messages.legacy_match_account(text) for text in texts} - {None}
+        golden[f"battletags/{corpus}"] = digest(sorted(scan()))
+
+    # Run
+    print(f"{'benchmark':<45} {'min':>10} {'median':>10}   (stub latency {args.latency * 1000:.0f} ms, {args.repeat} runs)")
+    for name, function in benchmarks.items():
+        if args.only not in name:
+            continue
+        times = measure(function, args.repeat)
+        print(f"{name:<45} {min(times) * 1000:>8.2f}ms {statistics.median(times) * 1000:>8.2f}ms")
+
+    for failure in failures:
+        print(failure)
+
+    # Golden outputs: json round trip so both sides compare the same way
+    golden = json.loads(json.dumps(golden))
+    if args.update_golden:
+        with open(GOLDEN_PATH, 'w') as f:
+            json.dump(golden, f, indent=1, ensure_ascii=False)
+        print(f"Golden outputs written to {GOLDEN_PATH}")
+        return 1 if failures else 0
+
+    with open(GOLDEN_PATH, 'r') as f:
+        expected = json.load(f)
+    mismatched = [name for name in sorted(expected.keys() | golden.keys()) if expected.get(name) != golden.get(name)]
+    for name in mismatched:
+        print(f"Golden output mismatch: {name}")
+    print("Golden outputs match" if not mismatched else f"{len(mismatched)} golden outputs changed")
+    return 1 if mismatched or failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
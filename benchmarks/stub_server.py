@@ -0,0 +1,90 @@
+"""
+A local stand-in for the SC2Pulse API, replaying the fixtures in benchmarks/fixtures.
+Point the bot at it with `API URL: http://127.0.0.1:<port>` in config.yml, or run it standalone:
+`python -m benchmarks.stub_server --port 8080 --latency 0.05`
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+from benchmarks import fixtures
+import argparse
+import re
+import threading
+import time
+
+class StubServer:
+    """
+    Serves /character/search and /character/{id}/common from the fixtures, after `latency` seconds.
+    Counts requests per endpoint, so benchmarks can check caching actually avoided them
+    """
+
+    def __init__(self, latency: float = 0.0, port: int = 0):
+        self.latency  = latency
+        self.requests = {'search': 0, 'history': 0}
+        self.search   = fixtures.load_raw('search')
+        self.common   = {character_id: fixtures.load_raw(f"common_{size}") for size, character_id in fixtures.load_index().items()}
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = urlparse(self.path).path
+                common = re.fullmatch(r'/character/(\d+)/common', path)
+                if path == '/character/search':
+                    stub.requests['search'] += 1
+                    body = stub.search
+                elif common and int(common.group(1)) in stub.common:
+                    stub.requests['history'] += 1
+                    body = stub.common[int(common.group(1))]
+                else:
+                    self.send_error(404)
+                    return
+
+                time.sleep(stub.latency)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'StubServer':
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds to wait before each response")
+    args = parser.parse_args()
+
+    stub = StubServer(args.latency, args.port)
+    print(f"Replaying fixtures at {stub.url} with {args.latency}s latency")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
@@ -2,15 +2,24 @@ import discord
 from discord import app_commands
 from discord.ext import tasks
 from pytz import timezone
-from modules.parse_facts import parse_player_facts
+from modules.parse_facts import fetch_player
+from modules.parse_pool import extract_facts_many, shutdown_pool
+from modules.search_player import close_session
+from modules.accounts import account_entry, resolve_account, needs_resolving, player_key
+from modules.battletags import find_battletags, BattleTagIndex
 from modules.config import config as global_config
+from modules.storage import ServerStore
+from modules.select_facts import select_facts
+from modules.log import setup_logging
+from modules import metrics
+import asyncio
 import datetime
+import logging
 import os
-import json
-import re
-from collections import defaultdict
-import traceback
-import warnings
+import time
+
+setup_logging()
+log = logging.getLogger('bot')
 
 # Set timezone
 tz = timezone('US/Pacific')
@@ -25,9 +34,16 @@ class BotClient(discord.Client):
         # Set up command tree for slash commands
         self.tree = app_commands.CommandTree(self)
         
-        # Create config directory if it doesn't exist
-        if not os.path.exists('server_configs'):
-            os.makedirs('server_configs')
+        # Server configs live in SQLite. Import the old per-server json files once, if there are any
+        self.store = ServerStore(global_config.get('server_database', 'server_configs.sqlite3'))
+        if os.path.isdir('server_configs'):
+            migrated = self.store.migrate_json_dir('server_configs')
+            log.info("Migrated %d server configs to %s", migrated, global_config.get('server_database', 'server_configs.sqlite3'))
+        
+        # Scan channels are kept in memory, so on_message can ignore all other channels cheaply
+        # Channels are "caught up" once fully scanned, after which live messages advance their scan cursor
+        self.scan_channels = self.store.scan_channels()
+        self.caught_up = set()
 
         self.setup_commands()
     
@@ -66,86 +82,259 @@ class BotClient(discord.Client):
             config['scan_channel'] = channel_id
             self.save_server_config(guild_id, config)
             
+            self.scan_channels = {channel: guild for channel, guild in self.scan_channels.items() if guild != guild_id}
+            self.scan_channels[channel_id] = guild_id
+            
             await interaction.response.send_message(f'BattleNet account scanning channel set to {interaction.channel.mention}', ephemeral=True)
+        
+        # Define scan_backfill command
+        @self.tree.command(name="scan_backfill", description="Rescan the entire history of the scan channel for BattleNet accounts")
+        async def scan_backfill(interaction: discord.Interaction):
+            # Check if user has manage channels permission
+            if not interaction.user.guild_permissions.manage_channels:
+                await interaction.response.send_message("You need 'Manage Channels' permission to use this command.", ephemeral=True)
+                return
+            
+            guild_id = str(interaction.guild_id)
+            
+            config = self.load_server_config(guild_id)
+            if not config.get('scan_channel'):
+                await interaction.response.send_message("Set a scan channel with /set_scan first.", ephemeral=True)
+                return
+            config['backfill_scan'] = True
+            self.save_server_config(guild_id, config)
+            
+            await interaction.response.send_message('The full history of the scan channel will be scanned on the next pass', ephemeral=True)
     
     async def setup_hook(self):
+        # Optional Prometheus endpoint, local only
+        if global_config.get('metrics_port'):
+            metrics.serve(global_config['metrics_port'])
+            log.info("Serving metrics at http://127.0.0.1:%s/metrics", global_config['metrics_port'])
+        
         # Start background tasks
         self.post_weekly.start()
         self.find_accounts.start()
+        self.revalidate_accounts.start()
         
         # Register slash commands with Discord
         await self.tree.sync()
     
+    async def close(self):
+        # Release the pooled SC2Pulse connections, and any parse workers
+        await close_session()
+        shutdown_pool()
+        await super().close()
+    
     async def on_ready(self):
-        print(f'Logged in as {self.user.name} ({self.user.id})')
-        print(f'Invite link: https://discord.com/api/oauth2/authorize?client_id={self.user.id}&permissions=2048&scope=bot%20applications.commands')
-        print('------')
+        log.info("Logged in as %s (%s)", self.user.name, self.user.id)
+        log.info("Invite link: https://discord.com/api/oauth2/authorize?client_id=%s&permissions=2048&scope=bot%%20applications.commands", self.user.id)
     
-    def load_server_config(self, guild_id):
-        """Load server config from file"""
-        config_path = os.path.join('server_configs', f'{guild_id}.json')
+    async def on_message(self, message):
+        """Pick up BattleNet accounts as soon as they are posted in a scan channel"""
+        guild_id = self.scan_channels.get(message.channel.id)
+        if guild_id is None:
+            return
+        
+        # Only move the scan cursor if no messages before this one could have been missed
+        cursor = (message.channel.id, message.id) if message.channel.id in self.caught_up else None
+        
+        battletags = find_battletags(message.content)
+        if not battletags:
+            if cursor:
+                self.store.save_accounts(guild_id, {}, cursor=cursor)
+            return
+        
+        # Tags already known under another spelling keep their stored name
+        accounts = self.load_server_config(guild_id)['bnet_accounts']
+        known = BattleTagIndex(accounts)
+        found = dict()
+        for battletag in battletags:
+            account_name = known.canonical(battletag)
+            entry = account_entry(accounts.get(account_name, message.author.id))
+            entry['discord_id'] = message.author.id
+            found[account_name] = entry
+            log.info("Found BattleNet account: %s in %s", account_name, message.guild.name)
+        self.store.save_accounts(guild_id, found, cursor=cursor)
         
-        if not os.path.exists(config_path):
+        if any(needs_resolving(entry) for entry in found.values()):
+            await self.resolve_accounts(guild_id)
+    
+    async def on_disconnect(self):
+        # Messages sent while disconnected are never delivered, leave them to the periodic scan
+        self.caught_up.clear()
+    
+    def load_server_config(self, guild_id):
+        """Load server config from the database"""
+        config = self.store.load(guild_id)
+        if config is None:
             return {
                 'weekly_channel': None,
                 'scan_channel': None, 
                 'last_weekly_post': datetime.datetime.min.replace(tzinfo=tz).isoformat(),
                 'bnet_accounts': {}
                 }
-        
-        with open(config_path, 'r') as f:
-            return json.load(f)
+        return config
     
     def save_server_config(self, guild_id, config):
-        """Save server config to file"""
-        config_path = os.path.join('server_configs', f'{guild_id}.json')
-        
-        with open(config_path, 'w') as f:
-            json.dump(config, f, indent=4)
+        """Save server config to the database"""
+        self.store.save(guild_id, config)
     
     def iter_servers(self):
         """Iterate through all server configs"""
-        for filename in os.listdir('server_configs'):
-            if filename.endswith('.json'):
-                guild_id = filename[:-5]  # Remove .json extension
-                config = self.load_server_config(guild_id)
-                yield guild_id, config
+        yield from self.store.iter_servers()
     
     @tasks.loop(hours=global_config['hours_between_scans'])
     async def find_accounts(self):
         """Scan channels for BattleNet accounts"""
-        print("Finding BattleNet accounts...")
+        log.info("Finding BattleNet accounts...")
+        before = metrics.snapshot()
         
-        # Iterate through all servers
-        for guild_id, config in self.iter_servers():
-            if not config.get('scan_channel'):
-                continue
+        # Servers are scanned concurrently, but only a few at a time to stay clear of Discord's rate limits
+        semaphore = asyncio.Semaphore(global_config.get('max_concurrent_scans', 4))
+        timeout = 60 * global_config.get('scan_timeout_minutes', 10)
+        
+        async def scan(guild_id, config):
+            async with semaphore:
+                start = time.monotonic()
+                try:
+                    await asyncio.wait_for(self.scan_guild(guild_id, config), timeout)
+                except asyncio.TimeoutError:
+                    log.warning("Scanning server %s timed out after %ss", guild_id, timeout)
+                except Exception:
+                    log.exception("Error scanning server %s", guild_id)
+                duration = time.monotonic() - start
+                # Unlabelled, so /metrics doesn't grow a series per server. The log below names the slowest
+                metrics.observe('guild_scan', duration)
             
-            guild = self.get_guild(int(guild_id))
-            if not guild:
-                continue
-                
-            channel = guild.get_channel(config['scan_channel'])
-            if not channel:
-                continue
+            # Look up new accounts on SC2Pulse once, so weekly posts don't have to search for them
+            # (done even if the scan timed out, as found accounts are saved as we go)
+            try:
+                await self.resolve_accounts(guild_id)
+            except Exception:
+                log.exception("Error resolving accounts in server %s", guild_id)
+            return guild_id, duration
+        
+        start = time.monotonic()
+        durations = await asyncio.gather(*(scan(guild_id, config) for guild_id, config in self.iter_servers() if config.get('scan_channel')))
+        
+        # Summary, slowest servers first
+        durations.sort(key=lambda x: x[1], reverse=True)
+        log.info("Scanned %d servers in %.1fs (%.1fs of scanning)", len(durations), time.monotonic() - start, sum(d for _, d in durations))
+        for guild_id, duration in durations[:5]:
+            log.info("\t%s: %.1fs", guild_id, duration)
+        log.info("Scan metrics: %s", metrics.summary(before))
+    
+    async def scan_guild(self, guild_id, config):
+        """Scan one server's scan channel for BattleNet accounts"""
+        guild = self.get_guild(int(guild_id))
+        if not guild:
+            return
             
-            print(f"Scanning messages in {guild.name}...")
-            accounts_found = 0
-            async for message in channel.history(limit=global_config['max_messages_scanned'], oldest_first=True):
-                # Check if message contains a BattleNet account
-                bnet_account = re.search(r'\w+\s*#\d{1,9}', message.content)
-                if bnet_account:
-                    # Add account to config
-                    account_name = re.sub(r'\s', '', bnet_account.group(0))
-                    config['bnet_accounts'][account_name] = message.author.id
-                    self.save_server_config(guild_id, config)
-                    print(f"\tFound BattleNet account: {account_name}")
+        channel = guild.get_channel(config['scan_channel'])
+        if not channel:
+            return
+        
+        # Only fetch messages newer than the last one scanned, unless a full backfill was requested
+        # backfill_scan is True for a new backfill, or the last message a timed out one got to
+        backfill = config.get('backfill_scan', False)
+        if backfill:
+            cursor = None if backfill is True else backfill
+        else:
+            cursor = self.store.get_cursor(channel.id)
+        after = discord.Object(id=cursor) if cursor else None
+        limit = None if backfill else global_config['max_messages_scanned']
+        
+        log.info("Scanning %s in %s...", 'full history' if backfill else 'new messages', guild.name)
+        accounts_found = 0
+        
+        # Found accounts are written in batches, together with how far we've scanned
+        # Whatever is pending is flushed even if the scan is cancelled
+        self.caught_up.discard(channel.id)
+        pending = dict()
+        known = BattleTagIndex(config['bnet_accounts'])
+        last_message = cursor
+        flush_every = global_config.get('account_flush_interval', 64)
+        finished = False
+        scanned = 0
+        try:
+            async for message in channel.history(limit=limit, after=after, oldest_first=True):
+                last_message = message.id
+                scanned += 1
+                # Add every BattleNet account in the message to config
+                for battletag in find_battletags(message.content):
+                    account_name = known.canonical(battletag)
+                    entry = account_entry(config['bnet_accounts'].get(account_name, message.author.id))
+                    entry['discord_id'] = message.author.id
+                    config['bnet_accounts'][account_name] = entry
+                    pending[account_name] = entry
+                    log.debug("\tFound BattleNet account: %s", account_name)
                     accounts_found += 1
-            print(f"Found {accounts_found} BattleNet accounts in {guild.name}")
+                
+                # Only between messages, so the cursor never moves past a half-saved one
+                if len(pending) >= flush_every:
+                    self.store.save_accounts(guild_id, pending, cursor=(channel.id, last_message))
+                    pending.clear()
+            finished = True
+        finally:
+            if last_message is not None:
+                self.store.save_accounts(guild_id, pending, cursor=(channel.id, last_message))
+            # A backfill cut short by the scan timeout carries on from here next pass, instead of starting over
+            if backfill and not finished and last_message != cursor:
+                config = self.load_server_config(guild_id)
+                if config.get('backfill_scan') == backfill: # unless /scan_backfill was used again meanwhile
+                    config['backfill_scan'] = last_message
+                    self.save_server_config(guild_id, config)
+        log.info("Found %d BattleNet accounts in %s", accounts_found, guild.name)
+        
+        # Stopping at the limit may leave newer messages for the next pass,
+        # so until then live messages mustn't move the cursor past them
+        if limit is None or scanned < limit:
+            self.caught_up.add(channel.id)
+        
+        if backfill:
+            config = self.load_server_config(guild_id)
+            config.pop('backfill_scan', None)
+            self.save_server_config(guild_id, config)
+    
+    async def resolve_accounts(self, guild_id, max_age:datetime.timedelta = None):
+        """Resolve a server's BattleTags to SC2Pulse characters, if never done or older than max_age"""
+        config = self.load_server_config(guild_id)
+        unresolved = [name for name, entry in config['bnet_accounts'].items() if needs_resolving(account_entry(entry), max_age)]
+        if not unresolved:
+            return
+        
+        log.info("Resolving %d BattleNet accounts...", len(unresolved))
+        results = await asyncio.gather(*(resolve_account(name) for name in unresolved), return_exceptions=True)
+        
+        # Config may have changed while we were waiting on SC2Pulse
+        config = self.load_server_config(guild_id)
+        resolved = dict()
+        for account_name, result in zip(unresolved, results):
+            if isinstance(result, Exception):
+                log.error("Error resolving BattleNet account %s: %s", account_name, result)
+                continue
+            if account_name not in config['bnet_accounts']:
+                continue
             
+            resolved[account_name] = account_entry(config['bnet_accounts'][account_name])
+            resolved[account_name].update(result)
+            if result['character_id'] is None:
+                log.info("\tCould not find BattleNet account %s on SC2Pulse", account_name)
+        self.store.save_accounts(guild_id, resolved)
+    
+    @tasks.loop(hours=global_config['hours_between_scans'])
+    async def revalidate_accounts(self):
+        """Re-resolve stored accounts in case characters were renamed or moved"""
+        max_age = datetime.timedelta(days=global_config.get('days_between_revalidation', 7))
+        for guild_id, _ in self.iter_servers():
+            await self.resolve_accounts(guild_id, max_age)
+    
     @tasks.loop(hours=global_config['hours_between_scans'])
     async def post_weekly(self):
-        """Post weekly announcement"""        
+        """Post weekly announcement"""
+        # Find every server that is due for a weekly post
+        due_servers = []
         for guild_id, config in self.iter_servers():
             if not config.get('weekly_channel'):
                 continue
@@ -163,62 +352,126 @@ class BotClient(discord.Client):
             if datetime.datetime.now(tz) - last_post < datetime.timedelta(days=7):
                 continue
             
-            print(f"Posting weekly announcement in {guild.name}...")
-
-            # Get ALL player stats
-            player_stats = list()
-            for account_name, _ in config['bnet_accounts'].items():
-                try:
-                    print(f"\tGetting player stats for {account_name}...")
-                    player_stats.extend(list(parse_player_facts(account_name, cutoff_date=last_post)))
-                except Exception as e:
-                    print(f"Error getting player stats for {account_name}: {e}")
-                    traceback.print_exc()
-                    print("\n")
-            
-            print('Player stats:')
-            for fact in sorted(player_stats, key=lambda fact: fact.impressive(), reverse=True):
-                print("\t", fact.player_name, fact, fact.impressive())
-                
-            # Remove low-interest facts & sort
-            player_stats = [fact for fact in player_stats if fact.impressive() > 5]
-
-            # Select facts with dynamic penalty for player diversity
-            selected_facts = []
-            player_penalties = defaultdict(lambda: 1.0)
-            while player_stats:
-                player_stats.sort(key=lambda fact: fact.impressive() * player_penalties[fact.player_id], reverse=True)
-                
-                top_fact = player_stats.pop(0)
-                selected_facts.append(top_fact)
-                
-                player_penalties[top_fact.player_id] *= 0.8
-            
-            # No facts - Skip this week
-            print(f"Found a total of {len(selected_facts)} facts")
-            if not selected_facts:
+            accounts = {account_name: account_entry(entry) for account_name, entry in config['bnet_accounts'].items()}
+            due_servers.append((guild_id, guild, channel, last_post, accounts))
+        
+        if not due_servers:
+            return
+        
+        # Players registered in several servers are only fetched once
+        # Accounts resolved at scan time go straight to their history, without searching
+        # Each player's history only needs to reach back to the oldest last post among their servers
+        players = dict()
+        cutoffs = dict()
+        for *_, last_post, accounts in due_servers:
+            for account_name, entry in accounts.items():
+                key = player_key(account_name, entry)
+                players.setdefault(key, (account_name, entry.get('character_id')))
+                cutoffs[key] = min(cutoffs.get(key, last_post), last_post)
+        
+        log.info("Getting player stats for %d players across %d servers...", len(players), len(due_servers))
+        before = metrics.snapshot()
+        player_keys = list(players)
+        with metrics.timer('weekly_fetch'):
+            results = await asyncio.gather(
+                *(fetch_player(*players[key], cutoff_date=cutoffs[key]) for key in player_keys),
+                return_exceptions=True
+            )
+        
+        fetched = dict()
+        for key, result in zip(player_keys, results):
+            if isinstance(result, Exception):
+                log.error("Error getting player stats for %s", players[key][0], exc_info=result)
                 continue
+            if result:
+                fetched[key] = result
+        
+        # Streaks, peaks and race counts depend on the reporting window, so facts can't just be
+        # filtered by timestamp afterwards. Parse once per player per distinct cutoff instead
+        # (spread over worker processes, if Parse Workers is set)
+        jobs = list(dict.fromkeys(
+            (key, last_post)
+            for *_, last_post, accounts in due_servers
+            for key in (player_key(account_name, entry) for account_name, entry in accounts.items())
+            if key in fetched
+        ))
+        results = await extract_facts_many([(*fetched[key], last_post) for key, last_post in jobs])
+        
+        parsed = dict()
+        for (key, last_post), result in zip(jobs, results):
+            if isinstance(result, Exception):
+                log.error("Error getting player stats for %s", players[key][0], exc_info=result)
+                result = []
+            parsed[(key, last_post)] = result
+        
+        durations = list()
+        for guild_id, guild, channel, last_post, accounts in due_servers:
+            player_stats = list()
+            for account_name, entry in accounts.items():
+                key = player_key(account_name, entry)
+                if (key, last_post) in parsed:
+                    player_stats.extend(parsed[(key, last_post)])
             
-            # Compose message of top 6 facts
-            message = f"Weekly stats for {datetime.datetime.now().strftime('%B %d, %Y')}:\n"
-            for i, fact in enumerate(selected_facts[:min(6, len(selected_facts))], start=1):
-                mention = fact.player_name
-                if fact.battle_tag in config['bnet_accounts']:
-                    mention += f" <@{config['bnet_accounts'][fact.battle_tag]}>"
-                else:
-                    warnings.warn(f"Warning: BattleTag {fact.battle_tag} not found in scanned channels")
-                message += f"{i}. {mention} {fact}\n"
+            start = time.monotonic()
+            with metrics.timer('guild_post'):
+                await self.post_guild_weekly(guild_id, guild, channel, accounts, player_stats)
+            durations.append((guild_id, time.monotonic() - start))
+        
+        # Slowest servers first
+        durations.sort(key=lambda x: x[1], reverse=True)
+        for guild_id, duration in durations[:5]:
+            log.info("\t%s: %.1fs", guild_id, duration)
+        log.info("Weekly post metrics: %s", metrics.summary(before))
+    
+    async def post_guild_weekly(self, guild_id, guild, channel, accounts, player_stats):
+        """Select the best facts for one server and post them"""
+        log.info("Posting weekly announcement in %s...", guild.name)
+        
+        # Sorting and formatting every fact is only worth it if someone will read it
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('Player stats:')
+            for fact in sorted(player_stats, key=lambda fact: fact.impressive(), reverse=True):
+                log.debug("\t %s %s %s", fact.player_name, fact, fact.impressive())
             
+        # Select the top 6 facts, with a dynamic penalty for player diversity (low-interest facts are dropped)
+        selected_facts = select_facts(player_stats, count=6)
+        
+        # No facts - Skip this week
+        log.info("Selected %d of %d facts", len(selected_facts), len(player_stats))
+        if not selected_facts:
+            return
+        
+        # Facts carry SC2Pulse's BattleTag, which may differ from what was posted in the scan channel
+        discord_ids = {account_name: entry['discord_id'] for account_name, entry in accounts.items()}
+        discord_ids.update({entry['battle_tag']: entry['discord_id'] for entry in accounts.values() if entry.get('battle_tag')})
+        
+        # Compose message of top 6 facts
+        message = f"Weekly stats for {datetime.datetime.now().strftime('%B %d, %Y')}:\n"
+        for i, fact in enumerate(selected_facts, start=1):
+            mention = fact.player_name
+            if fact.battle_tag in discord_ids:
+                mention += f" <@{discord_ids[fact.battle_tag]}>"
+            else:
+                log.warning("BattleTag %s not found in scanned channels", fact.battle_tag)
+            message += f"{i}. {mention} {fact}\n"
+        
+        with metrics.timer('discord_send'):
             await channel.send(message)
-            config['last_weekly_post'] = datetime.datetime.now(tz).isoformat()
-            self.save_server_config(guild_id, config)
+        
+        # Reload, as accounts may have been found while we were fetching stats
+        config = self.load_server_config(guild_id)
+        config['last_weekly_post'] = datetime.datetime.now(tz).isoformat()
+        self.save_server_config(guild_id, config)
     
     # Wait until bot is ready before starting tasks
     @find_accounts.before_loop
     @post_weekly.before_loop
+    @revalidate_accounts.before_loop
     async def before_tasks(self):
         await self.wait_until_ready()
 
 # Create and run bot
-client = BotClient()
-client.run(global_config['token'])
\ No newline at end of file
+# (guarded, as parse workers are spawned processes that import this module again)
+if __name__ == "__main__":
+    client = BotClient()
+    client.run(global_config['token'], log_handler=None) # logging is already set up by setup_logging
\ No newline at end of file
@@ -0,0 +1,54 @@
+from modules.search_player import search_player_async
+import datetime
+import re
+
+def account_entry(value) -> dict:
+    """
+    Normalizes a bnet_accounts entry.
+    Older configs only stored the discord user id, newer ones store the resolved SC2Pulse character too
+    """
+    if isinstance(value, dict):
+        return value
+    return {
+        'discord_id':   value,
+        'character_id': None,
+        'battle_tag':   None,
+        'name':         None,
+        'resolved':     None,
+    }
+
+async def resolve_account(search_term: str) -> dict:
+    """
+    Finds the SC2Pulse character for a scanned BattleTag.
+    Accounts that can't be found are still marked as resolved, so they aren't searched every scan
+    """
+    player = await search_player_async(search_term)
+    if not player:
+        return {
+            'character_id': None,
+            'battle_tag':   None,
+            'name':         None,
+            'resolved':     datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+
+    return {
+        'character_id': player["members"]["character"]["id"],
+        'battle_tag':   player["members"]["account"]["battleTag"],
+        'name':         re.match(r"^(.*?)#", player["members"]["character"]["name"]).group(1),
+        'resolved':     datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+def needs_resolving(entry: dict, max_age: datetime.timedelta = None) -> bool:
+    """True if an account was never looked up, or (given max_age) was looked up too long ago"""
+    if not entry.get('resolved'):
+        return True
+    if max_age is None:
+        return False
+    resolved = datetime.datetime.fromisoformat(entry['resolved'])
+    return datetime.datetime.now(datetime.timezone.utc) - resolved > max_age
+
+def player_key(account_name: str, entry: dict):
+    """Identifies the same player across servers: by character if resolved, otherwise by the scanned name"""
+    if entry.get('character_id'):
+        return ('character', entry['character_id'])
+    return ('name', account_name)
@@ -0,0 +1,99 @@
+from modules.factoids import MismatchedGame, LongGame, LongStreak, EloHigh, EloClimb, Promote, SwitchRace, ManyGames
+import numpy as np
+
+# Vectorized versions of each factoid's impressive(), for scoring many facts at once
+# Every function takes columns of factoid parameters and returns an array of impressiveness,
+# following the scalar formulas in modules/factoids.py step for step.
+# benchmarks/run.py fails if their scores drift from the factoids' own
+
+def smoid_scaling(x):
+    return 100 * (1 / (1 + np.exp(-(0.1 * x - 5))))
+
+def half_activation(x):
+    s = 1 / (1 + np.exp(-(10 * (x - 50) / 100)))
+    return 200 * s * (1 - s)
+
+def score_mismatched_game(my_elo, their_elo, won):
+    my_elo, their_elo, won = np.asarray(my_elo, dtype=float), np.asarray(their_elo, dtype=float), np.asarray(won, dtype=bool)
+    elo_diff = np.abs(my_elo - their_elo)
+
+    # Convert elo to chance of me winning
+    chance_to_win = 1 / (10 ** (elo_diff / 400) + 1)
+    chance_to_win = np.where(my_elo > their_elo, 1 - chance_to_win, chance_to_win)
+
+    underdog = np.where(won, np.maximum(0, 50 - 100 * chance_to_win) + 40 * (chance_to_win < 0.3), 0)
+    favorite = np.where(~won & (chance_to_win > 0.7), 50 * chance_to_win, 0)
+    raw = np.where(chance_to_win < 0.5, underdog, favorite)
+    return MismatchedGame.interest * smoid_scaling(raw)
+
+def score_long_game(duration, won):
+    duration, won = np.asarray(duration, dtype=float), np.asarray(won, dtype=bool)
+    raw = duration / 300 + 30 * won
+    return LongGame.interest * smoid_scaling(raw)
+
+def score_long_streak(streak, won):
+    streak, won = np.asarray(streak, dtype=float), np.asarray(won, dtype=bool)
+    raw = np.where(streak <= 1, 0, np.minimum(135, 5 * 1.4 ** streak * (1 + 0.5 * won)))
+    return LongStreak.interest * smoid_scaling(raw)
+
+def score_elo_high(elo):
+    raw = np.asarray(elo, dtype=float) / 500
+    return EloHigh.interest * smoid_scaling(raw)
+
+def score_elo_climb(elo_start, elo_end):
+    elo_diff = np.abs(np.asarray(elo_end, dtype=float) - np.asarray(elo_start, dtype=float))
+    chance_before = 1 / (1 + 10 ** (-elo_diff / 400))
+    raw = np.abs(chance_before - 0.5) * 300
+    return EloClimb.interest * smoid_scaling(raw)
+
+def score_promote(league):
+    max_league = len(Promote.LEAGUE_NAMES) - 1
+    raw = 100 * (np.asarray(league, dtype=float) + 1) / max_league
+    return Promote.interest * smoid_scaling(raw)
+
+def score_switch_race(games_by_race):
+    """games_by_race is an (n facts, n races) array of games played, columns in each fact's dict order"""
+    games = np.asarray(games_by_race, dtype=float).reshape(len(games_by_race), -1)
+    total_games = games.sum(axis=1)
+
+    # Offrace share: everything but the (first) most played race
+    with np.errstate(invalid='ignore', divide='ignore'):
+        percent = games / total_games[:, None]
+    percent[np.arange(len(games)), np.argmax(percent, axis=1)] = 0
+    offrace_games = percent.sum(axis=1)
+
+    raw = np.where(total_games == 0, 0, half_activation(offrace_games * 100))
+    return SwitchRace.interest * smoid_scaling(raw)
+
+def score_many_games(total_games):
+    total_games = np.asarray(total_games, dtype=float)
+    raw = np.where(total_games == 0, 0, 100 * np.clip(total_games / ManyGames.GAMES_FOR_MAX_INTEREST, 0, 1))
+    return ManyGames.interest * smoid_scaling(raw)
+
+def race_matrix(facts):
+    """Pads each fact's games_by_race (in dict order) into a rectangular array"""
+    width = max(len(fact.games_by_race) for fact in facts)
+    return [list(fact.games_by_race.values()) + [0] * (width - len(fact.games_by_race)) for fact in facts]
+
+# How to pull each factoid type's columns out of a list of facts
+COLUMNS = {
+    MismatchedGame: lambda facts: score_mismatched_game([f.my_elo for f in facts], [f.their_elo for f in facts], [f.won for f in facts]),
+    LongGame:       lambda facts: score_long_game([f.duration for f in facts], [f.won for f in facts]),
+    LongStreak:     lambda facts: score_long_streak([f.streak for f in facts], [f.won for f in facts]),
+    EloHigh:        lambda facts: score_elo_high([f.elo for f in facts]),
+    EloClimb:       lambda facts: score_elo_climb([f.elo_start for f in facts], [f.elo_end for f in facts]),
+    Promote:        lambda facts: score_promote([f.league for f in facts]),
+    SwitchRace:     lambda facts: score_switch_race(race_matrix(facts)),
+    ManyGames:      lambda facts: score_many_games([sum(f.games_by_race.values()) for f in facts]),
+}
+
+def score_factoids(facts) -> np.ndarray:
+    """Scores a mixed list of factoids, one array operation per factoid type. Returns scores in input order"""
+    scores = np.empty(len(facts))
+    by_type = dict()
+    for i, fact in enumerate(facts):
+        by_type.setdefault(type(fact), []).append(i)
+
+    for fact_type, indices in by_type.items():
+        scores[indices] = COLUMNS[fact_type]([facts[i] for i in indices])
+    return scores
@@ -0,0 +1,39 @@
+from anyascii import anyascii
+import re
+
+# BattleTags as Blizzard allows them: a 3-12 character name of letters (any script) and digits,
+# not starting with a digit, then # and a numeric code. Codes are 4-5 digits for BattleTags,
+# but 3+ for SC2 character names, which people post too and SC2Pulse can search for.
+# The name must start at a word boundary, so an overlong name isn't matched by its last 12 characters
+BATTLETAG = re.compile(r"(?<![\w#])([^\W\d_][^\W_]{2,11})[^\S\n]*#(\d{3,9})(?![\d#])")
+
+def find_battletags(content: str) -> list:
+    """All valid BattleTags in a message, in order of appearance, without repeats"""
+    if '#' not in content: # most messages, and much cheaper than running the pattern
+        return []
+    tags = dict()
+    for match in BATTLETAG.finditer(content):
+        tag = f"{match.group(1)}#{match.group(2)}"
+        tags.setdefault(battletag_key(tag), tag)
+    return list(tags.values())
+
+def battletag_key(tag: str) -> str:
+    """Compares BattleTags regardless of case, accents or lookalike characters"""
+    if tag.isascii():
+        return tag.lower()
+    return anyascii(tag).lower()
+
+class BattleTagIndex:
+    """
+    Maps every spelling of a BattleTag to the first one seen (e.g. a server's stored account name),
+    so the same account posted as Foo#1234 and foo#1234 is only stored once
+    """
+
+    def __init__(self, tags=()):
+        self.tags = dict()
+        for tag in tags:
+            self.tags.setdefault(battletag_key(tag), tag)
+
+    def canonical(self, tag: str) -> str:
+        """Returns the known spelling of a tag, remembering this one if it's new"""
+        return self.tags.setdefault(battletag_key(tag), tag)
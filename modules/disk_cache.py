@@ -0,0 +1,139 @@
+from collections.abc import MutableMapping
+from cachetools import TTLCache
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+class DiskCache(MutableMapping):
+    """
+    A persistent drop-in for cachetools.TTLCache, usable with @cached.
+    Values are stored as compressed json in an SQLite file, so they survive restarts.
+
+    Entries expire after `ttl` seconds, and the least recently used entries are evicted
+    once more than `maxsize` are stored. Expired entries are kept around (until evicted)
+    along with their ETag / Last-Modified, so callers can revalidate them cheaply.
+    """
+
+    def __init__(self, path: str, namespace: str, maxsize: int, ttl: float):
+        self.namespace = namespace
+        self.maxsize   = maxsize
+        self.ttl       = ttl
+        self.lock      = threading.Lock()
+
+        # Validators to attach to the next write of a key, see remember_validators
+        self.pending_validators = dict()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                namespace     TEXT NOT NULL,
+                key           TEXT NOT NULL,
+                value         BLOB NOT NULL,
+                expires       REAL NOT NULL,
+                accessed      REAL NOT NULL,
+                etag          TEXT,
+                last_modified TEXT,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache (namespace, accessed)")
+
+    @staticmethod
+    def _key(key) -> str:
+        # cachetools keys are tuples of the call arguments
+        return json.dumps(list(key) if isinstance(key, tuple) else key, default=str)
+
+    def __getitem__(self, key):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value FROM cache WHERE namespace = ? AND key = ? AND expires > ?",
+                (self.namespace, self._key(key), time.time())
+            ).fetchone()
+            if row is None:
+                raise KeyError(key)
+
+            self.db.execute(
+                "UPDATE cache SET accessed = ? WHERE namespace = ? AND key = ?",
+                (time.time(), self.namespace, self._key(key))
+            )
+        return json.loads(zlib.decompress(row[0]))
+
+    def __setitem__(self, key, value):
+        etag, last_modified = self.pending_validators.pop(key, (None, None))
+        blob = zlib.compress(json.dumps(value).encode())
+        now  = time.time()
+
+        with self.lock:
+            self.db.execute("BEGIN")
+            self.db.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.namespace, self._key(key), blob, now + self.ttl, now, etag, last_modified)
+            )
+
+            # Evict least recently used entries beyond maxsize
+            self.db.execute("""
+                DELETE FROM cache WHERE namespace = ? AND key IN (
+                    SELECT key FROM cache WHERE namespace = ?
+                    ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.namespace, self.namespace, self.maxsize)
+            )
+            self.db.execute("COMMIT")
+
+    def __delitem__(self, key):
+        with self.lock:
+            deleted = self.db.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, self._key(key))
+            ).rowcount
+        if not deleted:
+            raise KeyError(key)
+
+    def __iter__(self):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT key FROM cache WHERE namespace = ? AND expires > ?",
+                (self.namespace, time.time())
+            ).fetchall()
+        for (key,) in rows:
+            key = json.loads(key)
+            yield tuple(key) if isinstance(key, list) else key
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute(
+                "SELECT COUNT(*) FROM cache WHERE namespace = ? AND expires > ?",
+                (self.namespace, time.time())
+            ).fetchone()[0]
+
+    def stale(self, key):
+        """
+        Returns (value, etag, last_modified) for an entry that exists, fresh or expired.
+        Only useful if the entry has a validator to revalidate with, otherwise returns None.
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value, etag, last_modified FROM cache WHERE namespace = ? AND key = ? "
+                "AND (etag IS NOT NULL OR last_modified IS NOT NULL)",
+                (self.namespace, self._key(key))
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0])), row[1], row[2]
+
+    def remember_validators(self, key, etag: str, last_modified: str):
+        """Stores ETag / Last-Modified alongside the value that is about to be written for key"""
+        if etag or last_modified:
+            self.pending_validators[key] = (etag, last_modified)
+
+def make_cache(directory: str, namespace: str, maxsize: int, ttl: float):
+    """Persistent cache if a cache directory is configured, in-memory TTLCache otherwise"""
+    if not directory:
+        return TTLCache(maxsize=maxsize, ttl=ttl)
+    return DiskCache(os.path.join(directory, 'sc2pulse.sqlite3'), namespace, maxsize, ttl)
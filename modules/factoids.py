@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from math import exp
 
 clamp           = lambda x, y, z: max(y, min(x, z))
@@ -9,18 +9,25 @@ half_activation = lambda x: 200 * smoid(10*(x-50)/100) * (1-smoid(10*(x-50)/100)
 # Generally, the less probable an event is, the more impressive it is
 # This is a rough estimate, but definitely works
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Factoid:
-    """Superclass for interesting facts about a player"""
+    """
+    Superclass for interesting facts about a player.
+    Facts are immutable, so how impressive they are is only calculated once, on creation
+    """
     interest = float("NaN")
     
     timestamp: int
     player_id: int
     battle_tag: str
     player_name: str
+    score: float = field(init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        object.__setattr__(self, 'score', self.interest * smoid_scaling(self.calc_impressive()))
     
     def impressive(self):
-        return self.interest * smoid_scaling(self.calc_impressive())
+        return self.score
     
     def calc_impressive(self):
         """
@@ -46,7 +53,7 @@ class Factoid:
             return my_impr < other_impr
         
     
-@dataclass
+@dataclass(frozen=True, slots=True)
 class MismatchedGame(Factoid):
     """Applied when a player faces very low odds of winning"""
     interest = 0.8
@@ -106,7 +113,7 @@ class MismatchedGame(Factoid):
             else:
                 return f"Lost against an opponent of similar strength (~{int(100 * chance_to_win)}% chance to win)"
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class LongGame(Factoid):
     """Applied when a player plays a very long game"""
     interest = 0.6
@@ -130,7 +137,7 @@ class LongGame(Factoid):
         else:
             return f"Lost a {very}long game ({duration_mins} mins)"
     
-@dataclass
+@dataclass(frozen=True, slots=True)
 class LongStreak(Factoid):
     """Applied when a player has a very long win streak"""
     interest = 0.6
@@ -151,7 +158,7 @@ class LongStreak(Factoid):
         else:
             return f"Lost {self.streak} games in a row"
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class EloHigh(Factoid):
     """Applied when a player's elo is very high"""
     interest = 0.9
@@ -164,7 +171,7 @@ class EloHigh(Factoid):
     def __str__(self) -> str:
         return f"Peaked at {self.elo} elo"
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class EloClimb(Factoid):
     """Applied when a player's elo rises"""
     interest = 0.9
@@ -192,7 +199,7 @@ class EloClimb(Factoid):
         else:
             return f"Dropped from {self.elo_start} to {self.elo_end} elo (-{elo_diff} points)"
     
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Promote(Factoid):
     """Applied when a player is promoted to a new league"""
     interest = 1
@@ -219,7 +226,7 @@ class Promote(Factoid):
     def __str__(self) -> str:
         return f"Promoted to {self.LEAGUE_NAMES[self.league]} league"
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class SwitchRace(Factoid):
     """Applied when a player switches race"""
     interest = 0.7
@@ -259,7 +266,7 @@ class SwitchRace(Factoid):
         msg += f"normally {primary_race}"
         return msg
     
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ManyGames(Factoid):
     GAMES_FOR_MAX_INTEREST = 150
     interest = 0.6
@@ -0,0 +1,44 @@
+from modules.config import config
+import json
+import logging
+import sys
+
+# Attributes every LogRecord has. Anything else was passed with extra={...} and goes into json output
+RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+class JsonFormatter(logging.Formatter):
+    """One json object per line, for log collectors"""
+
+    def format(self, record):
+        entry = {
+            'time':    self.formatTime(record),
+            'level':   record.levelname,
+            'logger':  record.name,
+            'message': record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in RECORD_ATTRS})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def setup_logging():
+    """
+    Configures logging from config.yml:
+        Log Level:  INFO                       # for everything
+        Log Levels: {modules.parse_facts: DEBUG} # per module overrides
+        Log Format: text                       # or json
+    """
+    handler = logging.StreamHandler(sys.stdout)
+    if config.get('log_format', 'text') == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)-7s %(name)s: %(message)s'))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(str(config.get('log_level', 'INFO')).upper())
+    for name, level in (config.get('log_levels') or {}).items():
+        logging.getLogger(name).setLevel(str(level).upper())
+
+    # warnings.warn from libraries ends up in the same place
+    logging.captureWarnings(True)
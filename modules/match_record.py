@@ -0,0 +1,94 @@
+from modules.timestamps import safe_dateparse
+from modules.traverse import traverse
+import datetime
+
+class MatchRecord:
+    """
+    One match, seen from one player's side.
+    Built once when a match is fetched, so fact parsing never has to walk SC2Pulse's nested dicts.
+    Matches that aren't a readable two-sided 1v1 keep their id, date and type, but aren't `decoded`
+    """
+    __slots__ = (
+        'match_id', 'date', 'type', 'map', 'duration', 'decoded',
+        'decision', 'league', 'rating', 'rating_change', 'opponent_rating',
+    )
+
+    # Column order used by to_row / from_row, and by the match store's table
+    COLUMNS = __slots__
+
+    def __init__(self, match_id, date: datetime.datetime, type: str, map: str = None, duration: int = None, decoded: bool = False,
+                 decision: str = None, league: int = None, rating: int = None, rating_change: int = None, opponent_rating: int = None):
+        self.match_id        = match_id
+        self.date            = date
+        self.type            = type
+        self.map             = map
+        self.duration        = duration
+        self.decoded         = decoded
+        self.decision        = decision
+        self.league          = league
+        self.rating          = rating
+        self.rating_change   = rating_change
+        self.opponent_rating = opponent_rating
+
+    @property
+    def won(self) -> bool:
+        return self.decision == "WIN"
+
+    @classmethod
+    def from_match(cls, match: dict, character_id: int) -> 'MatchRecord':
+        """Reads a match from SC2Pulse's /common response, from the side of the given character"""
+        record = cls(
+            # Matches without an id still need something unique to be stored under
+            match_id = traverse(match, 'match', 'id') or traverse(match, 'match', 'date'),
+            date     = safe_dateparse(traverse(match, 'match', 'date')),
+            type     = traverse(match, 'match', 'type'),
+            map      = traverse(match, 'map', 'name'),
+            duration = traverse(match, 'match', 'duration'),
+        )
+
+        # Fact parsing skips everything but 1v1s, so don't bother reading their participants
+        if record.type != "_1V1":
+            return record
+
+        # Decypher the match: who am I and who is my opponent?
+        participants = match.get('participants') or []
+        if len(participants) != 2:
+            return record
+        if any(traverse(team, 'team', 'members') is None for team in participants):
+            return record
+
+        team_zero, team_one = participants
+        if any(traverse(member, 'character', 'id') == character_id for member in team_zero['team']['members']):
+            my_team, other_team = team_zero, team_one
+        else:
+            my_team, other_team = team_one, team_zero
+
+        record.decoded         = True
+        record.decision        = traverse(my_team, 'participant', 'decision')
+        record.league          = traverse(my_team, 'team', 'league', 'type')
+        record.rating          = traverse(my_team, 'team', 'rating')
+        record.rating_change   = traverse(my_team, 'participant', 'ratingChange')
+        record.opponent_rating = traverse(other_team, 'team', 'rating')
+        return record
+
+    def to_row(self) -> tuple:
+        """Flattens the record for storage, with the date as a unix timestamp"""
+        return tuple(getattr(self, column) if column != 'date' else self.date.timestamp() for column in self.COLUMNS)
+
+    @classmethod
+    def from_row(cls, row) -> 'MatchRecord':
+        record = cls(*row)
+        record.date    = datetime.datetime.fromtimestamp(record.date, datetime.timezone.utc)
+        record.decoded = bool(record.decoded)
+        return record
+
+    def __reduce__(self):
+        # Pickled as a plain tuple of fields, which is much faster than the default for slotted classes
+        return MatchRecord, tuple(getattr(self, column) for column in self.COLUMNS)
+
+    def __repr__(self) -> str:
+        return f"MatchRecord({', '.join(f'{column}={getattr(self, column)!r}' for column in self.COLUMNS)})"
+
+def match_records(matches: list, character_id: int) -> list:
+    """Builds records for every match of a /common response"""
+    return [MatchRecord.from_match(match, character_id) for match in matches]
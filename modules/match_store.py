@@ -0,0 +1,165 @@
+from modules.match_record import MatchRecord, match_records
+from modules.storage import Transaction
+from modules.timestamps import safe_dateparse
+import datetime
+import os
+import sqlite3
+import time
+
+# Bumped whenever the tables change. It's only a cache of what SC2Pulse returned, so older stores are just dropped
+SCHEMA_VERSION = 2
+
+# Stands in for a missing queueType or teamId in the history table's primary key, as SQLite never treats NULLs as duplicates
+MISSING = -1
+
+# Rows older than this are dropped, matching the most history SC2Pulse is ever asked for
+RETENTION_DAYS = 180
+
+class MatchStore:
+    """
+    Local SQLite store of every match and MMR history row already fetched for a player.
+    Each run only needs to fetch what happened since the newest stored row,
+    and facts are parsed from the stored rows in the reporting window.
+    """
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.db.execute("DROP TABLE IF EXISTS matches")
+            self.db.execute("DROP TABLE IF EXISTS history")
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+        # One row per MatchRecord, from the side of the player it was fetched for
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS matches (
+                character_id    INTEGER NOT NULL,
+                match_id        TEXT NOT NULL,
+                date            REAL NOT NULL,
+                type            TEXT,
+                map             TEXT,
+                duration        INTEGER,
+                decoded         INTEGER NOT NULL,
+                decision        TEXT,
+                league          INTEGER,
+                rating          INTEGER,
+                rating_change   INTEGER,
+                opponent_rating INTEGER,
+                PRIMARY KEY (character_id, match_id)
+            )
+        """)
+        # Only the columns of /common's history block that the parsers read
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS history (
+                character_id INTEGER NOT NULL,
+                date_time    TEXT NOT NULL,
+                date         REAL NOT NULL,
+                queue_type   INTEGER NOT NULL,
+                team_id      INTEGER NOT NULL,
+                race         TEXT,
+                PRIMARY KEY (character_id, date_time, queue_type, team_id)
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS matches_date ON matches (character_id, date)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS history_date ON history (character_id, date)")
+
+    def latest(self, character_id: int) -> datetime.datetime:
+        """Returns when the newest stored row of a player is from, or None if nothing is stored"""
+        # Matches and history rows arrive separately, so only trust what both tables have caught up to
+        row = self.db.execute(
+            "SELECT (SELECT MAX(date) FROM matches WHERE character_id = ?), "
+            "       (SELECT MAX(date) FROM history WHERE character_id = ?)",
+            (character_id, character_id)
+        ).fetchone()
+        if None in row:
+            return None
+        return datetime.datetime.fromtimestamp(min(row), datetime.timezone.utc)
+
+    def fetch_since(self, character_id: int, cutoff_date: datetime.datetime = None) -> datetime.datetime:
+        """How far back a fetch needs to go to fill in everything since cutoff_date"""
+        latest = self.latest(character_id)
+        if cutoff_date is None or latest is None:
+            return cutoff_date
+        return max(cutoff_date, latest)
+
+    def ingest(self, character_id: int, history: dict) -> int:
+        """Stores the matches and history rows of a /common response. Returns the number of new matches"""
+        matches = match_records(history.get('matches') or [], character_id)
+        columns = history.get('history') or {}
+        date_times = columns.get('dateTime', [])
+        history_rows = zip(
+            date_times,
+            columns.get('queueType', [None] * len(date_times)),
+            columns.get('teamId', [None] * len(date_times)),
+            columns.get('race', [None] * len(date_times)),
+        )
+
+        count = "SELECT COUNT(*) FROM matches WHERE character_id = ?"
+        with Transaction(self.db):
+            before = self.db.execute(count, (character_id,)).fetchone()[0]
+            # SC2Pulse fills in teams and ratings after a match is first listed, so the latest response wins
+            self.db.executemany(
+                f"INSERT INTO matches (character_id, {', '.join(MatchRecord.COLUMNS)}) "
+                f"VALUES (?, {', '.join('?' * len(MatchRecord.COLUMNS))}) "
+                f"ON CONFLICT (character_id, match_id) DO UPDATE SET "
+                f"{', '.join(f'{column} = excluded.{column}' for column in MatchRecord.COLUMNS if column != 'match_id')}",
+                ((character_id, *match.to_row()) for match in matches)
+            )
+            new_matches = self.db.execute(count, (character_id,)).fetchone()[0] - before
+
+            self.db.executemany(
+                "INSERT OR IGNORE INTO history VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        character_id, date_time, safe_dateparse(date_time).timestamp(),
+                        MISSING if queue_type is None else queue_type, MISSING if team_id is None else team_id, race
+                    )
+                    for date_time, queue_type, team_id, race in history_rows
+                    if isinstance(date_time, str)
+                )
+            )
+
+            oldest = time.time() - RETENTION_DAYS * 24 * 60 * 60
+            self.db.execute("DELETE FROM matches WHERE character_id = ? AND date < ?", (character_id, oldest))
+            self.db.execute("DELETE FROM history WHERE character_id = ? AND date < ?", (character_id, oldest))
+        return new_matches
+
+    def window(self, character_id: int, cutoff_date: datetime.datetime = None) -> dict:
+        """
+        Returns the stored matches and history since cutoff_date, shaped like the matches and history
+        blocks of a /common response, except that matches are MatchRecords (newest first)
+        """
+        cutoff = cutoff_date.timestamp() if cutoff_date is not None else float('-inf')
+
+        rows = self.db.execute(
+            f"SELECT {', '.join(MatchRecord.COLUMNS)} FROM matches WHERE character_id = ? AND date >= ? "
+            "ORDER BY date DESC, match_id DESC",
+            (character_id, cutoff)
+        )
+        matches = [MatchRecord.from_row(row) for row in rows]
+
+        rows = self.db.execute(
+            f"SELECT date_time, NULLIF(queue_type, {MISSING}), race FROM history WHERE character_id = ? AND date >= ? ORDER BY date",
+            (character_id, cutoff)
+        ).fetchall()
+        date_times, queue_types, races = (list(column) for column in zip(*rows)) if rows else ([], [], [])
+
+        return {
+            'matches': matches,
+            'history': {'dateTime': date_times, 'queueType': queue_types, 'race': races},
+        }
+
+    def merge(self, character_id: int, history: dict, cutoff_date: datetime.datetime = None) -> dict:
+        """Ingests a freshly fetched /common response, and returns it with its matches and history read back from the store"""
+        self.ingest(character_id, history)
+        return {**history, **self.window(character_id, cutoff_date)}
+
+def make_match_store(directory: str):
+    """Match store in the cache directory, or None if caching to disk is turned off"""
+    if not directory:
+        return None
+    return MatchStore(os.path.join(directory, 'matches.sqlite3'))
@@ -0,0 +1,151 @@
+from collections import defaultdict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+# Counters and timers for every stage of a run, kept in memory
+# Exposed as Prometheus text by serve(), and summarized at the end of each scan / weekly post
+# Keys are (metric name, sorted label items)
+PREFIX   = 'sc2recap_'
+LOCK     = threading.Lock()
+COUNTERS = defaultdict(float)
+TIMERS   = defaultdict(lambda: [0.0, 0]) # [total seconds, count]
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def inc(name: str, value: float = 1, **labels):
+    """Adds to a counter"""
+    with LOCK:
+        COUNTERS[_key(name, labels)] += value
+
+def observe(name: str, seconds: float, **labels):
+    """Records one timing"""
+    with LOCK:
+        timer = TIMERS[_key(name, labels)]
+        timer[0] += seconds
+        timer[1] += 1
+
+@contextmanager
+def timer(name: str, **labels):
+    """Times the body of a with block, whether or not it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+# Labels kept apart in summaries. Everything else (endpoint, type, ...) is summed over
+SUMMARY_LABELS = {'result'}
+
+def _summary_name(name: str, items: tuple) -> str:
+    return '_'.join([name, *(value for key, value in items if key in SUMMARY_LABELS)])
+
+def snapshot() -> dict:
+    """Current totals of every metric: {name: total} and {name_count: count} for timers"""
+    totals = defaultdict(float)
+    with LOCK:
+        for (name, items), value in COUNTERS.items():
+            totals[_summary_name(name, items)] += value
+        for (name, items), (seconds, count) in TIMERS.items():
+            totals[_summary_name(name, items)] += seconds
+            totals[f"{_summary_name(name, items)}_count"] += count
+    return dict(totals)
+
+def summary(since: dict) -> str:
+    """One line of what changed since an earlier snapshot()"""
+    now   = snapshot()
+    delta = {name: value - since.get(name, 0) for name, value in now.items()}
+    parts = []
+    for name, value in sorted(delta.items()):
+        if name.endswith('_count') or not value:
+            continue
+        if f"{name}_count" in delta:
+            parts.append(f"{name}={value:.2f}s/{int(delta[f'{name}_count'])}")
+        else:
+            parts.append(f"{name}={value:g}")
+    return ', '.join(parts) if parts else 'nothing recorded'
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    def labels(items):
+        if not items:
+            return ''
+        return '{' + ','.join(f'{key}="{value}"' for key, value in items) + '}'
+
+    lines = []
+    with LOCK:
+        counters = sorted(COUNTERS.items())
+        timers   = sorted((key, tuple(value)) for key, value in TIMERS.items())
+
+    typed = set()
+    for (name, items), value in counters:
+        if name not in typed:
+            lines.append(f"# TYPE {PREFIX}{name}_total counter")
+            typed.add(name)
+        lines.append(f"{PREFIX}{name}_total{labels(items)} {value:g}")
+    for (name, items), (seconds, count) in timers:
+        if name not in typed:
+            lines.append(f"# TYPE {PREFIX}{name}_seconds summary")
+            typed.add(name)
+        lines.append(f"{PREFIX}{name}_seconds_sum{labels(items)} {seconds:.6f}")
+        lines.append(f"{PREFIX}{name}_seconds_count{labels(items)} {count}")
+    return '\n'.join(lines) + '\n'
+
+def serve(port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Serves render() at http://host:port/metrics from a background thread"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class MeteredCache(MutableMapping):
+    """Wraps a cache to count its hits and misses. Anything else (like DiskCache.stale) is passed through"""
+
+    def __init__(self, cache, name: str):
+        self.cache = cache
+        self.name  = name
+
+    def __getitem__(self, key):
+        try:
+            value = self.cache[key]
+        except KeyError:
+            inc('cache_requests', cache=self.name, result='miss')
+            raise
+        inc('cache_requests', cache=self.name, result='hit')
+        return value
+
+    def __setitem__(self, key, value):
+        self.cache[key] = value
+
+    def __delitem__(self, key):
+        del self.cache[key]
+
+    def __iter__(self):
+        return iter(self.cache)
+
+    def __len__(self):
+        return len(self.cache)
+
+    def clear(self):
+        self.cache.clear()
+
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
@@ -1,17 +1,21 @@
-from modules.factoids import MismatchedGame, LongGame, LongStreak, EloHigh, Promote, SwitchRace, ManyGames, EloClimb
-from modules.search_player import search_player, get_player_history
+from modules.factoids import MismatchedGame, LongStreak, EloHigh, Promote, SwitchRace, ManyGames, EloClimb
+from modules.search_player import search_player_async, get_player_history_async, close_session, CACHE_DIRECTORY
+from modules.match_store import make_match_store
+from modules.match_record import match_records
+from modules import metrics
 from modules.traverse import traverse
-from itertools import zip_longest
+from modules.timestamps import safe_dateparse
+from itertools import compress
+import asyncio
 import datetime
-import dateutil.parser
+import logging
+import operator
 import re
+import time
+import numpy as np
 from collections import Counter
 
-def safe_dateparse(date_str:str):
-    try:
-        return dateutil.parser.parse(date_str)
-    except:
-        return datetime.datetime(year=1, month=1, day=1, tzinfo=datetime.timezone.utc)
+log = logging.getLogger(__name__)
 
 def parse_player_history(player, history, cutoff_date:datetime.datetime = datetime.datetime(year=1, month=1, day=1, tzinfo=datetime.timezone.utc)):
     """Parses all match history for a player and yields all interesting facts"""
@@ -20,46 +24,34 @@ def parse_player_history(player, history, cutoff_date:datetime.datetime = dateti
     battle_tag = player["members"]["account"]["battleTag"]
     player_name = re.match(r"^(.*?)#", player["members"]["character"]["name"]).group(1)
     
-    # The rest of the events must come from history. Let's put it into a parseable format
-    HISTORY_KEYS = ['teamId', # nonsense
-                    'race', # race played by this player
-                    'dateTime', # datetime of game
-                    'leagueRank', # rank in the league
-                    'games', # culmulative count of games played of this queueType
-                    'teamType', # nonsense (always 0?)
-                    'leagueType', # 0 is bronze, etc...
-                    'wins', # culmulative count of wins of this queueType
-                    'leagueTeamCount',
-                    'queueType', # 201 is autoMM
-                    'globalRank', # rank in the world
-                    'season', # season of game
-                    'regionRank', # rank in the region (NA) <-- most useful
-                    'globalTeamCount' # nonsense
-                    ]
+    # The rest of the events must come from history
+    # history['history'] holds parallel arrays (one entry per snapshot) for keys like:
+    #   race      - race played by this player
+    #   dateTime  - datetime of game
+    #   queueType - 201 is autoMM
+    #   games, wins, leagueType, leagueRank, globalRank, regionRank, season, teamId, ...
+    # Rather than building a dict per row, keep them as arrays and filter with masks
+    columns    = history['history']
+    date_times = [safe_dateparse(date) for date in columns.get('dateTime', [])]
+    if len(date_times) == 0:
+        return
     
-    # history['history'] has one entry for each key in HISTORY_KEYS
-    # we want to convert this to a list of dicts, where each dict has the keys as keys, and the values as values
-    all_hist = []
-    history['history']['dateTime'] = [safe_dateparse(date) for date in history['history']['dateTime']]
-    values = [history['history'].get(key, []) for key in HISTORY_KEYS]
-    for entry in zip_longest(*values, fillvalue=None):
-        hist_dict = {key: value for key, value in zip(HISTORY_KEYS, entry)}
-        if hist_dict['race'] is not None:
-            hist_dict['race'] = hist_dict['race'].lower()
-        if hist_dict['dateTime'] < cutoff_date:
-            continue
-        if hist_dict['queueType'] != 201:
-            continue
-        
-        all_hist.append(hist_dict)
+    rows        = len(date_times)
+    timestamps  = np.array([date.timestamp() for date in date_times])
+    queue_types = np.array(columns.get('queueType', [])[:rows], dtype=float) # missing/None become NaN
+    queue_types = np.pad(queue_types, (0, rows - len(queue_types)), constant_values=np.nan)
     
-    if len(all_hist) == 0:
+    keep = (timestamps >= cutoff_date.timestamp()) & (queue_types == 201)
+    if not keep.any():
         return
     
+    races = columns.get('race', [])[:rows]
+    races = races + [None] * (rows - len(races))
+    
     # Event 1: Offracing
-    race_counts        = Counter(hist_dict['race'] for hist_dict in all_hist)
+    race_counts        = Counter(race.lower() if race is not None else None for race in compress(races, keep))
     yield SwitchRace(
-        timestamp   = max(history['history']['dateTime']),
+        timestamp   = max(date_times),
         player_id   = player_id,
         player_name = player_name,
         battle_tag  = battle_tag,
@@ -69,7 +61,7 @@ def parse_player_history(player, history, cutoff_date:datetime.datetime = dateti
     
     # Event 2: Many Games
     yield ManyGames(
-        timestamp   = max(history['history']['dateTime']),
+        timestamp   = max(date_times),
         player_id   = player_id,
         player_name = player_name,
         battle_tag  = battle_tag,
@@ -95,40 +87,41 @@ def parse_player_matches(player, matches, cutoff_date:datetime.datetime = dateti
     max_league      = None
     league_switches = 0
     
+    # Matches come in as MatchRecords, already decoded from this player's side (see modules/match_record.py)
+    # SC2Pulse returns matches newest first, so normally we can stop at the first match before the cutoff
+    # That's not documented though, so only rely on it if it actually holds
+    match_dates  = [match.date for match in matches]
+    newest_first = all(map(operator.ge, match_dates, match_dates[1:]))
+    
+    # Checked once rather than per match: this is the hot loop
+    debug = log.isEnabledFor(logging.DEBUG)
+    
     # We need to reverse-calculate this to get the elo for every match
     current_elo          = player["currentStats"]["rating"] # NONE
     for match in matches:
-        # Decypher the match: who am I and who is my opponent?
-        if len(match["participants"]) != 2: continue
-        
-        team_zero = match["participants"][0]
-        team_one = match["participants"][1]
-        
-        if traverse(team_zero, 'team', 'members') is None: continue
-        if traverse(team_one, 'team', 'members') is None : continue
+        match_date = match.date
         
         # Ignore games before cutoff date
-        if safe_dateparse(match["match"]["date"]) < cutoff_date:
+        if match_date < cutoff_date:
+            if newest_first:
+                break
             continue
         
         # For now: ignore all non-1v1s
         # Very hard to compare 1v1s to team games and arcade
-        if match["match"]["type"] != "_1V1":
+        if match.type != "_1V1":
             continue
         
-        if any(x['character']['id'] == player_id for x in team_zero["team"]["members"]):
-            my_team    = team_zero
-            other_team = team_one
-        else: 
-            my_team    = team_one
-            other_team = team_zero
+        # Matches we couldn't tell the sides of
+        if not match.decoded: continue
         
         # Update Stats
-        won           = my_team["participant"]["decision"] == "WIN"
-        curr_division = my_team["team"]["league"]["type"]
-        elo           = my_team["team"]["rating"]
+        won           = match.won
+        curr_division = match.league
+        elo           = match.rating
         
-        print(f"match found: {my_team['team']['league']['type']} {my_team['team']['rating']} {my_team['participant']['decision']} {my_team['participant']['ratingChange']} {match['match']['date']}")
+        if debug:
+            log.debug("match found: %s %s %s %s %s", match.league, match.rating, match.decision, match.rating_change, match_date.isoformat())
         if highest_after_lowest == None:
             highest_elo = elo
             lowest_elo = elo
@@ -143,11 +136,11 @@ def parse_player_matches(player, matches, cutoff_date:datetime.datetime = dateti
             lowest_elo = elo
         
         # Update current elo (if we won, the current elo of the past is less than the current elo now)
-        if my_team["participant"]["ratingChange"] is not None:
+        if match.rating_change is not None:
             if won:
-                current_elo -= my_team["participant"]["ratingChange"]
+                current_elo -= match.rating_change
             else:
-                current_elo += my_team["participant"]["ratingChange"]
+                current_elo += match.rating_change
         
         # Event 0: Promote? I don't really understand how divisions work so commented out
         # print("division", curr_division)
@@ -158,7 +151,7 @@ def parse_player_matches(player, matches, cutoff_date:datetime.datetime = dateti
         #     max_league = curr_division
             
         #     yield Promote(
-        #         timestamp   = safe_dateparse(match["match"]["date"]),
+        #         timestamp   = match_date,
         #         player_id   = player_id,
         #         player_name = player_name,
         #         battle_tag  = battle_tag,
@@ -167,28 +160,20 @@ def parse_player_matches(player, matches, cutoff_date:datetime.datetime = dateti
         #     )
         
         # Event 1: Possible Mismatch?
-        if traverse(other_team, 'team', 'rating') is not None:
+        if match.opponent_rating is not None:
             yield MismatchedGame(
-                timestamp   = safe_dateparse(match["match"]["date"]),
+                timestamp   = match_date,
                 player_id   = player_id,
                 player_name = player_name,
                 battle_tag  = battle_tag,
                 
                 my_elo    = current_elo,                  #my_team["team"]["rating"] would be logical, but is too often null,
-                their_elo = other_team["team"]["rating"],
+                their_elo = match.opponent_rating,
                 won       = won,
             )
         
-        # Event 2: Long Game?
-        if traverse(match, 'duration') is not None:
-            yield LongGame(
-                timestamp   = safe_dateparse(match["match"]["date"]),
-                player_id   = player_id,
-                player_name = player_name,
-                battle_tag  = battle_tag,
-                
-                duration = match["duration"],
-            )
+        # No LongGame: it never fired before match records, as it read a top-level "duration" SC2Pulse doesn't send
+        # Now that match.duration is real, its scoring needs tuning before it can be turned on
         
         # Event 2: Streak?
         if won:
@@ -196,7 +181,7 @@ def parse_player_matches(player, matches, cutoff_date:datetime.datetime = dateti
                 streak_count += 1
             else:
                 yield LongStreak(
-                    timestamp   = safe_dateparse(match["match"]["date"]),
+                    timestamp   = match_date,
                     player_id   = player_id,
                     player_name = player_name,
                     battle_tag  = battle_tag,
@@ -213,7 +198,7 @@ def parse_player_matches(player, matches, cutoff_date:datetime.datetime = dateti
                 streak_count += 1
             else:
                 yield LongStreak(
-                    timestamp   = safe_dateparse(match["match"]["date"]),
+                    timestamp   = match_date,
                     player_id   = player_id,
                     player_name = player_name,
                     battle_tag  = battle_tag,
@@ -225,10 +210,13 @@ def parse_player_matches(player, matches, cutoff_date:datetime.datetime = dateti
                 streak_count = 1
                 streak_won   = False
     
+    # Summary facts are timestamped with the last match returned, whether or not we got that far
+    match_date = match_dates[-1] if match_dates else None
+    
     # Clean up streak data
     if streak_count > 0: 
         yield LongStreak(
-            timestamp   = safe_dateparse(match["match"]["date"]),
+            timestamp   = match_date,
             player_id   = player_id,
             player_name = player_name,
             battle_tag  = battle_tag,
@@ -240,7 +228,7 @@ def parse_player_matches(player, matches, cutoff_date:datetime.datetime = dateti
     if highest_elo > 0 and lowest_elo > 0:
         #  Event 3            : Elo Peak
         yield EloHigh(
-            timestamp   = safe_dateparse(match["match"]["date"]),
+            timestamp   = match_date,
             player_id   = player_id,
             player_name = player_name,
             battle_tag  = battle_tag,
@@ -250,7 +238,7 @@ def parse_player_matches(player, matches, cutoff_date:datetime.datetime = dateti
         
         # Event 4: Elo Climb
         yield EloClimb(
-            timestamp   = safe_dateparse(match["match"]["date"]),
+            timestamp   = match_date,
             player_id   = player_id,
             player_name = player_name,
             battle_tag  = battle_tag,
@@ -261,28 +249,88 @@ def parse_player_matches(player, matches, cutoff_date:datetime.datetime = dateti
         
         
 
-def parse_player_facts(search_term, cutoff_date:datetime.datetime = datetime.datetime(year=1, month=1, day=1, tzinfo=datetime.timezone.utc)):
-    # TODO: a lot of info we'd like to rely on is null
+# Matches already fetched, so each run only has to fetch what's new. None if there's no cache directory
+MATCH_STORE = make_match_store(CACHE_DIRECTORY)
+
+def find_linked_player(history, character_id):
+    """Finds the character's own search-style entry among the history's linked characters"""
+    for linked in history.get('linkedDistinctCharacters') or []:
+        if traverse(linked, 'members', 'character', 'id') == character_id:
+            return linked
+    return None
+
+def fetch_since(character_id, cutoff_date:datetime.datetime = None) -> datetime.datetime:
+    return MATCH_STORE.fetch_since(character_id, cutoff_date) if MATCH_STORE is not None else cutoff_date
+
+async def fetch_player(search_term, character_id:int = None, cutoff_date:datetime.datetime = None):
+    """
+    Looks up a player and their history. Returns (player, history), or None if they can't be found.
+    history's matches are MatchRecords.
+    If the character id was already resolved, the search is skipped entirely.
+    Given a cutoff date, only enough history to cover it is fetched.
+    With a match store, that's only what happened since the last fetch, and the matches and history
+    returned are read back from the store instead.
+    """
+    player = None
+    if character_id is not None:
+        history = await get_player_history_async(character_id, fetch_since(character_id, cutoff_date))
+        player  = find_linked_player(history, character_id)
     
-    player = search_player(search_term)
+    # Unresolved, or the character wasn't linked to itself: fall back to searching
     if not player:
-        return
+        player = await search_player_async(search_term)
+        if not player:
+            return None
+        character_id = player["members"]["character"]["id"]
+        history = await get_player_history_async(character_id, fetch_since(character_id, cutoff_date))
+    
+    if MATCH_STORE is not None:
+        return player, MATCH_STORE.merge(character_id, history, cutoff_date)
+    return player, {**history, 'matches': match_records(history.get('matches') or [], character_id)}
+
+def extract_facts(player, history, cutoff_date:datetime.datetime = datetime.datetime(year=1, month=1, day=1, tzinfo=datetime.timezone.utc)) -> list:
+    """Returns a list of all interesting facts since cutoff_date from an already fetched player"""
+    # TODO: a lot of info we'd like to rely on is null
     
     player_id = player["members"]["character"]["id"]
     battle_tag = player["members"]["account"]["battleTag"]
     player_name = re.match(r"^(.*?)#", player["members"]["character"]["name"]).group(1)
-    history = get_player_history(player_id)
-    print(f"player_id={player_id}, battle_tag={battle_tag}, player_name={player_name}, history found: {len(history.get('matches',[]))}")
-    for fact in parse_player_matches(player, history['matches'], cutoff_date=cutoff_date):
-        yield fact
-        
-    for fact in parse_player_history(player, history, cutoff_date=cutoff_date):
-        yield fact
+    log.debug("player_id=%s, battle_tag=%s, player_name=%s, history found: %d", player_id, battle_tag, player_name, len(history.get('matches',[])))
+    
+    start = time.perf_counter()
+    facts = list(parse_player_matches(player, history['matches'], cutoff_date=cutoff_date))
+    facts.extend(parse_player_history(player, history, cutoff_date=cutoff_date))
+    record_parse(time.perf_counter() - start, facts)
+    return facts
+
+def record_parse(seconds: float, facts: list):
+    """Metrics for one player's parse, wherever it ran"""
+    metrics.observe('parse', seconds)
+    for fact_type, count in Counter(type(fact).__name__ for fact in facts).items():
+        metrics.inc('facts', count, type=fact_type)
+
+async def parse_player_facts(search_term, cutoff_date:datetime.datetime = datetime.datetime(year=1, month=1, day=1, tzinfo=datetime.timezone.utc), character_id:int = None) -> list:
+    """Looks up a player and returns a list of all their interesting facts since cutoff_date"""
+    fetched = await fetch_player(search_term, character_id, cutoff_date)
+    if not fetched:
+        return []
+    return extract_facts(*fetched, cutoff_date=cutoff_date)
 
 if __name__ == "__main__":
-    week_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=7)
-    for i, event in enumerate(sorted(list(parse_player_facts("GiantDwarf#1120200", cutoff_date=week_ago)), reverse=True)):
-        print(f"event {i}: {event}")
-        print(f"score={event.impressive()},\traw_score={event.calc_impressive()}")
-        print()
-        print()
\ No newline at end of file
+    from modules.log import setup_logging
+    setup_logging()
+    
+    async def main():
+        week_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=7)
+        try:
+            facts = await parse_player_facts("GiantDwarf#1120200", cutoff_date=week_ago)
+        finally:
+            await close_session()
+        
+        for i, event in enumerate(sorted(facts, reverse=True)):
+            print(f"event {i}: {event}")
+            print(f"score={event.impressive()},\traw_score={event.calc_impressive()}")
+            print()
+            print()
+    
+    asyncio.run(main())
@@ -0,0 +1,130 @@
+from modules.factoids import MismatchedGame, LongGame, LongStreak, EloHigh, EloClimb, Promote, SwitchRace, ManyGames
+from modules.parse_facts import parse_player_matches, parse_player_history, extract_facts, record_parse
+from modules.config import config
+from modules.timestamps import safe_dateparse
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import fields
+import asyncio
+import datetime
+import logging
+import math
+import multiprocessing
+import pickle
+import time
+
+log = logging.getLogger(__name__)
+
+# Optional worker processes for fact extraction, so big weekly runs use every core
+# and parsing doesn't block the Discord event loop. 0 parses in-process, as before
+PARSE_WORKERS = config.get('parse_workers', 0)
+
+FACT_TYPES = {fact_type.__name__: fact_type for fact_type in (MismatchedGame, LongGame, LongStreak, EloHigh, EloClimb, Promote, SwitchRace, ManyGames)}
+
+def fact_tuple(fact) -> tuple:
+    """(type name, *constructor arguments): all it takes to rebuild a fact, and cheap to pickle"""
+    return (type(fact).__name__, *(getattr(fact, field.name) for field in fields(fact) if field.init))
+
+def from_fact_tuple(values: tuple):
+    return FACT_TYPES[values[0]](*values[1:])
+
+def extract_fact_tuples(player, history, cutoff_date: datetime.datetime) -> tuple:
+    """Parses one player, returning (seconds taken, fact tuples)"""
+    start = time.perf_counter()
+    facts = list(parse_player_matches(player, history['matches'], cutoff_date=cutoff_date))
+    facts.extend(parse_player_history(player, history, cutoff_date=cutoff_date))
+    return time.perf_counter() - start, [fact_tuple(fact) for fact in facts]
+
+def extract_chunk(jobs: list) -> list:
+    """Runs in a worker: parses several (player, history, cutoff) jobs. Failed jobs return their exception"""
+    results = []
+    for job in jobs:
+        try:
+            results.append(extract_fact_tuples(*job))
+        except Exception as e:
+            results.append(e)
+    return results
+
+def compact_job(player, history, cutoff_date: datetime.datetime) -> tuple:
+    """
+    Trims a job down to what the parsers can see, since everything sent to a worker is pickled.
+    Rows before the cutoff are skipped by the parsers, except that the last match and the newest
+    history row timestamp the summary facts, so those are kept. Order is preserved
+    """
+    matches = history['matches']
+    matches = [match for match in matches[:-1] if match.date >= cutoff_date] + matches[-1:]
+
+    columns = history['history']
+    dates   = [safe_dateparse(date) for date in columns.get('dateTime', [])]
+    newest  = dates.index(max(dates)) if dates else None
+    rows    = [i for i, date in enumerate(dates) if date >= cutoff_date or i == newest]
+    columns = {key: [columns[key][i] if i < len(columns[key]) else None for i in rows] for key in ('dateTime', 'queueType', 'race') if key in columns}
+
+    player = {'members': player['members'], 'currentStats': player['currentStats']}
+    return player, {'matches': matches, 'history': columns}, cutoff_date
+
+POOL = None
+def get_pool() -> ProcessPoolExecutor:
+    """The shared worker pool, or None if parsing should happen in-process"""
+    global POOL, PARSE_WORKERS
+    if POOL is None and PARSE_WORKERS > 0:
+        try:
+            # Workers are spawned rather than forked: the bot has threads (and a running event loop) that forking would copy
+            POOL = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        except (OSError, NotImplementedError, ValueError) as e:
+            log.warning("Could not start %d parse workers, parsing in-process instead: %s", PARSE_WORKERS, e)
+            PARSE_WORKERS = 0
+    return POOL
+
+def disable_pool(reason):
+    """Falls back to in-process parsing for the rest of the run"""
+    global POOL, PARSE_WORKERS
+    log.warning("Parse workers failed, parsing in-process from now on: %s", reason)
+    if POOL is not None:
+        POOL.shutdown(wait=False, cancel_futures=True)
+    POOL = None
+    PARSE_WORKERS = 0
+
+def shutdown_pool():
+    global POOL
+    if POOL is not None:
+        POOL.shutdown(wait=True, cancel_futures=True)
+    POOL = None
+
+async def extract_facts_many(jobs: list) -> list:
+    """
+    Runs extract_facts on every (player, history, cutoff) job, in worker processes if a pool is configured.
+    Returns a list of facts per job, or the exception it raised.
+    Jobs are sent in a few chunks per worker, as one job alone is usually cheaper to parse than to send
+    """
+    if not jobs:
+        return []
+    pool = get_pool()
+    if pool is None:
+        return [extract_facts_or_exception(*job) for job in jobs]
+
+    chunk_size = max(1, math.ceil(len(jobs) / (PARSE_WORKERS * 4)))
+    chunks = [[compact_job(*job) for job in jobs[i:i + chunk_size]] for i in range(0, len(jobs), chunk_size)]
+    loop = asyncio.get_running_loop()
+    try:
+        chunk_results = await asyncio.gather(*(loop.run_in_executor(pool, extract_chunk, chunk) for chunk in chunks))
+    except (BrokenProcessPool, pickle.PicklingError) as e:
+        disable_pool(e)
+        return [extract_facts_or_exception(*job) for job in jobs]
+
+    results = []
+    for result in (result for chunk in chunk_results for result in chunk):
+        if isinstance(result, Exception):
+            results.append(result)
+            continue
+        seconds, tuples = result
+        facts = [from_fact_tuple(values) for values in tuples]
+        record_parse(seconds, facts)
+        results.append(facts)
+    return results
+
+def extract_facts_or_exception(player, history, cutoff_date: datetime.datetime):
+    try:
+        return extract_facts(player, history, cutoff_date)
+    except Exception as e:
+        return e
@@ -0,0 +1,47 @@
+import json
+
+# ijson is optional: with it, unused parts of a response are never built into python objects
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# The only parts of a /common response fact parsing uses
+# matches and history are parsed, linkedDistinctCharacters finds an already resolved player
+HISTORY_KEYS = ('matches', 'history', 'linkedDistinctCharacters')
+
+# Streaming is slower than json.loads, but never holds the whole tree at once
+# Only worth it for responses big enough for their peak memory to matter
+STREAM_THRESHOLD = 4 * 1024 * 1024
+
+# ijson events that complete a value
+VALUE_END = {'end_map', 'end_array', 'null', 'boolean', 'integer', 'double', 'number', 'string'}
+
+def project_history(raw: bytes) -> dict:
+    """Decodes a /common response, keeping only HISTORY_KEYS. Teams and stats are dropped"""
+    if ijson is None or len(raw) < STREAM_THRESHOLD:
+        payload = json.loads(raw)
+        return {key: payload[key] for key in HISTORY_KEYS if key in payload}
+    return stream_project(raw, HISTORY_KEYS)
+
+def stream_project(raw: bytes, keys) -> dict:
+    """Streams a json object, only building the values of the given top-level keys"""
+    result  = dict()
+    key     = None
+    builder = None
+    for prefix, event, value in ijson.parse(raw, use_float=True):
+        if prefix == '':
+            # The top-level object itself: only its keys matter
+            if event == 'map_key':
+                key     = value
+                builder = ijson.ObjectBuilder() if value in keys else None
+            continue
+
+        if builder is None:
+            continue
+
+        builder.event(event, value)
+        if prefix == key and event in VALUE_END:
+            result[key] = builder.value
+            builder = None
+    return result
@@ -0,0 +1,103 @@
+import asyncio
+import threading
+import time
+import random
+import email.utils
+
+class TokenBucket:
+    """
+    Classic token bucket: refills `rate` tokens per second, holding at most `burst`.
+    Tokens are reserved rather than waited for, so the bucket may go into debt.
+    Every caller is handed its own slot in line and nobody holds the lock while sleeping.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate    = float(rate)
+        self.burst   = max(1.0, float(burst))
+        self.tokens  = self.burst
+        self.updated = time.monotonic()
+        self.lock    = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens  = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Takes one token and returns how many seconds the caller must wait before using it"""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def penalize(self, delay: float):
+        """Pushes everyone who hasn't reserved yet back by at least `delay` seconds"""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, 0) - delay * self.rate
+
+class RateLimiter:
+    """A global token bucket, plus optional tighter buckets for individual endpoints"""
+
+    def __init__(self, rate: float, burst: float, endpoints: dict = None):
+        self.bucket    = TokenBucket(rate, burst)
+        self.endpoints = {
+            name: TokenBucket(budget.get('rate', rate), budget.get('burst', burst))
+            for name, budget in (endpoints or {}).items()
+        }
+
+    def buckets(self, endpoint: str = None) -> list:
+        """
+        The buckets a request has to get a token from, the endpoint's own first.
+        The global token is only taken once the endpoint allows the request, so requests queued
+        behind a tight endpoint don't use up the global budget other endpoints could be using meanwhile
+        """
+        if endpoint in self.endpoints:
+            return [self.endpoints[endpoint], self.bucket]
+        return [self.bucket]
+
+    def acquire(self, endpoint: str = None) -> float:
+        """Blocks until a request may be made, returns the time spent waiting"""
+        waited = 0.0
+        for bucket in self.buckets(endpoint):
+            delay = bucket.reserve()
+            if delay > 0:
+                time.sleep(delay)
+                waited += delay
+        return waited
+
+    async def acquire_async(self, endpoint: str = None) -> float:
+        """Same as acquire, but yields to the event loop while waiting"""
+        waited = 0.0
+        for bucket in self.buckets(endpoint):
+            delay = bucket.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                waited += delay
+        return waited
+
+    def penalize(self, delay: float):
+        # 429s are per-client, so every endpoint has to back off
+        self.bucket.penalize(delay)
+
+def retry_after_seconds(header: str) -> float:
+    """Parses a Retry-After header (either seconds or an HTTP date). Returns None if absent or invalid"""
+    if not header:
+        return None
+
+    try:
+        return max(0.0, float(header))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(header)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, retry_after: str = None, base: float = 1.0, cap: float = 60.0) -> float:
+    """Exponential backoff with jitter, unless the server told us exactly how long to wait"""
+    delay = retry_after_seconds(retry_after)
+    if delay is not None:
+        return delay
+    return min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.0)
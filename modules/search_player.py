@@ -1,16 +1,140 @@
 import requests
-from cachetools import cached, TTLCache
+import aiohttp
+import asyncio
+from cachetools import cached
+from cachetools.keys import hashkey
 from Levenshtein import ratio
+from modules.config import config
+from modules.rate_limit import RateLimiter, backoff_delay
+from modules.disk_cache import make_cache
+from modules.projection import project_history
+from modules import metrics
+import datetime
+import json
+import logging
+import math
 import time
-import traceback
 
-LAST_REQUEST_TIME = 0
-TIME_BETWEEN_REQUESTS = 0.5
-def wait_for_request():
-    global LAST_REQUEST_TIME
-    if LAST_REQUEST_TIME + TIME_BETWEEN_REQUESTS > time.monotonic():
-        time.sleep(LAST_REQUEST_TIME + TIME_BETWEEN_REQUESTS - time.monotonic())
-    LAST_REQUEST_TIME = time.monotonic()
+log = logging.getLogger(__name__)
+
+# Overridable so benchmarks can point the client at a local stub server
+API_URL = config.get('api_url', "https://sc2pulse.nephest.com/sc2/api")
+
+# One limiter shared by every API call, sync or async
+LIMITER = RateLimiter(
+    rate      = config.get('requests_per_second', 2),
+    burst     = config.get('request_burst', 4),
+    endpoints = config.get('endpoint_rate_limits', {}),
+)
+MAX_RETRIES    = config.get('max_retries', 5)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def wait_for_request(endpoint: str = None) -> float:
+    waited = LIMITER.acquire(endpoint)
+    metrics.observe('request_wait', waited, endpoint=endpoint or 'other')
+    return waited
+
+async def wait_for_request_async(endpoint: str = None) -> float:
+    waited = await LIMITER.acquire_async(endpoint)
+    metrics.observe('request_wait', waited, endpoint=endpoint or 'other')
+    return waited
+
+def retry_delay(status: int, attempt: int, retry_after: str, endpoint: str):
+    """
+    Decides whether a failed request is worth retrying.
+    Returns None if not, otherwise how long this caller should sleep before trying again.
+    """
+    if status not in RETRY_STATUSES or attempt >= MAX_RETRIES:
+        return None
+    
+    delay = backoff_delay(attempt, retry_after)
+    log.warning("SC2Pulse returned %s for %s, retrying in %.1fs (attempt %d/%d)", status, endpoint, delay, attempt + 1, MAX_RETRIES)
+    
+    # Rate limited: every caller needs to slow down, not just us. The limiter will do the waiting
+    if status == 429:
+        LIMITER.penalize(delay)
+        return 0
+    return delay
+
+def conditional_headers(stale) -> dict:
+    """Request headers to revalidate a stale cache entry (from DiskCache.stale)"""
+    headers = dict()
+    if stale is not None:
+        _, etag, last_modified = stale
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+    return headers
+
+def get_json(url: str, endpoint: str, cache=None, key=None, decode=json.loads):
+    """
+    GETs a url as json, respecting the rate limit and retrying on 429/5xx.
+    If given the cache and key the result will be stored under, stale entries are revalidated.
+    decode turns the response body into the result, e.g. to keep only part of it
+    """
+    stale = cache.stale(key) if hasattr(cache, 'stale') else None
+    for attempt in range(MAX_RETRIES + 1):
+        wait_for_request(endpoint)
+        start = time.perf_counter()
+        query = requests.get(url, headers=conditional_headers(stale))
+        metrics.observe('http_request', time.perf_counter() - start, endpoint=endpoint, status=query.status_code)
+        delay = retry_delay(query.status_code, attempt, query.headers.get('Retry-After'), endpoint)
+        if delay is not None:
+            time.sleep(delay)
+            continue
+        
+        if query.status_code == 304 and stale is not None:
+            cache.remember_validators(key, stale[1], stale[2])
+            return stale[0]
+        
+        query.raise_for_status()
+        if hasattr(cache, 'remember_validators'):
+            cache.remember_validators(key, query.headers.get('ETag'), query.headers.get('Last-Modified'))
+        with metrics.timer('decode', endpoint=endpoint):
+            return decode(query.content)
+
+async def get_json_async(url: str, endpoint: str, cache=None, key=None, decode=json.loads):
+    """Async equivalent of get_json"""
+    stale = cache.stale(key) if hasattr(cache, 'stale') else None
+    for attempt in range(MAX_RETRIES + 1):
+        await wait_for_request_async(endpoint)
+        start = time.perf_counter()
+        async with get_session().get(url, headers=conditional_headers(stale)) as query:
+            body = await query.read()
+            metrics.observe('http_request', time.perf_counter() - start, endpoint=endpoint, status=query.status)
+            
+            delay = retry_delay(query.status, attempt, query.headers.get('Retry-After'), endpoint)
+            if delay is None:
+                if query.status == 304 and stale is not None:
+                    cache.remember_validators(key, stale[1], stale[2])
+                    return stale[0]
+                
+                query.raise_for_status()
+                if hasattr(cache, 'remember_validators'):
+                    cache.remember_validators(key, query.headers.get('ETag'), query.headers.get('Last-Modified'))
+                with metrics.timer('decode', endpoint=endpoint):
+                    return decode(body)
+        await asyncio.sleep(delay)
+
+# Shared, pooled HTTP session for the async client
+# Must be created inside the running event loop, so it is made lazily
+MAX_CONNECTIONS = 8
+SESSION = None
+def get_session() -> aiohttp.ClientSession:
+    global SESSION
+    if SESSION is None or SESSION.closed:
+        SESSION = aiohttp.ClientSession(
+            connector = aiohttp.TCPConnector(limit=MAX_CONNECTIONS),
+            timeout   = aiohttp.ClientTimeout(total=60),
+        )
+    return SESSION
+
+async def close_session():
+    global SESSION
+    if SESSION is not None and not SESSION.closed:
+        await SESSION.close()
+    SESSION = None
 
 def eval_search(search_term: str, query_item: dict) -> float:
     """
@@ -35,34 +159,92 @@ def eval_search(search_term: str, query_item: dict) -> float:
     
     return max(0.65 * character_score, 0.8 * battle_tag_score, 0.6 * account_name_score)
 
-@cached(cache=TTLCache(maxsize=1024, ttl=3*24*60*60))
+def best_result(search_term: str, query_results: list):
+    """Picks the search result that best matches the search term"""
+    if not query_results:
+        return None
+    result_scores = {eval_search(search_term, item): item for item in query_results}
+    return result_scores[max(result_scores)]
+
+# Caches are shared by the sync and async clients (keys are identical)
+# Persisted to disk unless the cache directory is configured as null
+CACHE_DIRECTORY = config.get('cache_directory', 'cache')
+SEARCH_CACHE    = metrics.MeteredCache(make_cache(CACHE_DIRECTORY, 'search', maxsize=1024, ttl=3*24*60*60), 'search')
+# History entries only hold the parts of the response fact parsing needs, see modules/projection.py
+HISTORY_CACHE   = metrics.MeteredCache(make_cache(CACHE_DIRECTORY, 'history', maxsize=1024, ttl=24*60*60), 'history')
+
+@cached(cache=SEARCH_CACHE)
 def search_raw(search_term: str) -> list:
-    wait_for_request()
-    query = requests.get(f"https://sc2pulse.nephest.com/sc2/api/character/search?term={search_term}")
-    query.raise_for_status()
-    return query.json()
+    return get_json(f"{API_URL}/character/search?term={search_term}", 'search', SEARCH_CACHE, hashkey(search_term))
  
 def search_player(name):
     try:
-        query_results = search_raw(name)
-        if not query_results:
-            return None
-        result_scores = {eval_search(name, item): item for item in query_results}
-        return result_scores[max(result_scores)]
+        return best_result(name, search_raw(name))
+    
+    except requests.exceptions.HTTPError:
+        log.exception("Error searching for player %s", name)
+        return None
+
+# Only the window being reported on is fetched: 1v1 matches (all the parsers look at), and enough
+# days of MMR history to reach the cutoff. Depth is rounded up to whole weeks so weekly runs share cache entries
+MAX_HISTORY_DEPTH = 180
+def history_depth(cutoff_date: datetime.datetime = None) -> int:
+    """Days of MMR history needed to cover everything since cutoff_date"""
+    if cutoff_date is None:
+        return MAX_HISTORY_DEPTH
+    days = (datetime.datetime.now(datetime.timezone.utc) - cutoff_date).total_seconds() / (24*60*60)
+    return max(7, min(MAX_HISTORY_DEPTH, 7 * math.ceil(days / 7)))
+
+def history_url(player_id, depth: int) -> str:
+    return f"{API_URL}/character/{player_id}/common?matchType=_1V1&mmrHistoryDepth={depth}"
+
+@cached(cache=HISTORY_CACHE)
+def get_player_history(player_id, depth: int = MAX_HISTORY_DEPTH):
+    return get_json(history_url(player_id, depth), 'history', HISTORY_CACHE, hashkey(player_id, depth), project_history)
+
+# Requests currently in flight, so concurrent lookups of the same key share one download
+IN_FLIGHT = dict()
+async def fetch_cached_async(cache, key, url, endpoint, decode=json.loads):
+    """Async equivalent of @cached: check the cache, otherwise GET the url as json and store it"""
+    try:
+        return cache[key]
+    except KeyError:
+        pass
+    
+    flight_key = (id(cache), key)
+    if flight_key in IN_FLIGHT:
+        return await asyncio.shield(IN_FLIGHT[flight_key])
+    
+    async def fetch():
+        result = await get_json_async(url, endpoint, cache, key, decode)
+        cache[key] = result
+        return result
+    
+    task = asyncio.ensure_future(fetch())
+    IN_FLIGHT[flight_key] = task
+    try:
+        return await asyncio.shield(task)
+    finally:
+        IN_FLIGHT.pop(flight_key, None)
+
+async def search_raw_async(search_term: str) -> list:
+    return await fetch_cached_async(SEARCH_CACHE, hashkey(search_term), f"{API_URL}/character/search?term={search_term}", 'search')
+
+async def search_player_async(name):
+    try:
+        return best_result(name, await search_raw_async(name))
     
-    except requests.exceptions.HTTPError as e:
-        print(f"Error searching for player {name}: {e}")
-        traceback.print_exc()
+    except aiohttp.ClientResponseError:
+        log.exception("Error searching for player %s", name)
         return None
 
-@cached(cache=TTLCache(maxsize=1024, ttl=24*60*60))
-def get_player_history(player_id):
-    wait_for_request()        
-    query = requests.get(f"https://sc2pulse.nephest.com/sc2/api/character/{player_id}/common?matchType=&mmrHistoryDepth=180")
-    query.raise_for_status()
-    return query.json()
+async def get_player_history_async(player_id, cutoff_date: datetime.datetime = None):
+    depth = history_depth(cutoff_date)
+    return await fetch_cached_async(HISTORY_CACHE, hashkey(player_id, depth), history_url(player_id, depth), 'history', project_history)
 
 if __name__ == "__main__":
+    from modules.log import setup_logging
+    setup_logging()
     print(search_player("Pop101"))
     # {'leagueMax': 4, 'ratingMax': 3364, 'totalGamesPlayed': 392, 'previousStats': {'rating': 2921, 'gamesPlayed': 7, 'rank': 57897}, 'currentStats': {'rating': 3190, 'gamesPlayed': 58, 'rank': 41324}, 'members': {'protossGamesPlayed': 392, 'character': {'realm': 1, 'name': 'Pop#245', 'id': 165465170, 'accountId': 165465241, 'region': 'US', 'battlenetId': 4991826, 'tag': 'Pop', 'discriminator': 245}, 'account': {'battleTag': 'Pop101#1282', 'id': 165465241, 'partition': 'GLOBAL', 'hidden': None, 'tag': 'Pop101', 'discriminator': 1282}, 'clan': {'tag': 'dubzh', 'id': 124392, 'region': 'US', 'name': 'DAWGZ', 'members': 4, 'activeMembers': 2, 'avgRating': 2928, 'avgLeagueType': 4, 'games': 223}, 'raceGames': {'PROTOSS': 392}}}
     print(get_player_history(search_player("Pop101")["members"]["character"]["id"]))
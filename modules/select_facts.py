@@ -0,0 +1,45 @@
+from collections import defaultdict
+import heapq
+
+def select_facts(facts, count: int = 6, min_impressive: float = 5, penalty: float = 0.8) -> list:
+    """
+    Picks the `count` most impressive facts, penalizing players every time one of their facts is picked
+    so the weekly post isn't all about one person.
+
+    Gives the same result as repeatedly (stable) sorting by impressive() * player penalty and taking the head,
+    but uses a lazy heap: a player's heap entries are only rescored when they surface after that player was penalized.
+    """
+    facts  = [fact for fact in facts if fact.impressive() > min_impressive]
+    scores = [fact.impressive() for fact in facts]
+
+    player_penalties = defaultdict(lambda: 1.0)
+    player_picks     = defaultdict(int) # acts as a version number for a player's heap entries
+    last_penalized   = dict()           # pick number at which a player was last penalized
+
+    # Ties are broken the way the repeated stable sort would: facts of the most recently penalized
+    # player come first (they were ahead before the penalty), then by original order
+    # Entries: (-score, -last penalized, index, version)
+    heap = [(-score, 1, i, 0) for i, score in enumerate(scores)]
+    heapq.heapify(heap)
+
+    selected_facts = []
+    while heap and len(selected_facts) < count:
+        _, _, i, version = heapq.heappop(heap)
+        player_id = facts[i].player_id
+
+        # Stale entry: the player was penalized since it was pushed. Rescore and try again
+        if version != player_picks[player_id]:
+            heapq.heappush(heap, (
+                -scores[i] * player_penalties[player_id],
+                -last_penalized[player_id],
+                i,
+                player_picks[player_id],
+            ))
+            continue
+
+        selected_facts.append(facts[i])
+        player_penalties[player_id] *= penalty
+        player_picks[player_id] += 1
+        last_penalized[player_id] = len(selected_facts)
+
+    return selected_facts
@@ -0,0 +1,173 @@
+import json
+import os
+import sqlite3
+
+# Columns of the guilds table. Any other config keys are kept in its `extra` json column
+GUILD_KEYS   = ['weekly_channel', 'scan_channel', 'last_weekly_post']
+ACCOUNT_KEYS = ['discord_id', 'character_id', 'battle_tag', 'name', 'resolved']
+
+class ServerStore:
+    """
+    SQLite-backed storage for per-server configs.
+    Configs are loaded and saved as the same dicts the old server_configs/<guild>.json files held.
+    """
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS guilds (
+                guild_id         TEXT PRIMARY KEY,
+                weekly_channel   INTEGER,
+                scan_channel     INTEGER,
+                last_weekly_post TEXT,
+                extra            TEXT NOT NULL DEFAULT '{}'
+            )
+        """)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS accounts (
+                guild_id     TEXT NOT NULL,
+                account_name TEXT NOT NULL,
+                discord_id   INTEGER,
+                character_id INTEGER,
+                battle_tag   TEXT,
+                name         TEXT,
+                resolved     TEXT,
+                PRIMARY KEY (guild_id, account_name)
+            )
+        """)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS scan_cursors (
+                channel_id INTEGER PRIMARY KEY,
+                guild_id   TEXT NOT NULL,
+                message_id INTEGER NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS accounts_battle_tag ON accounts (battle_tag)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS accounts_character ON accounts (character_id)")
+
+    @staticmethod
+    def _account_row(guild_id, account_name, entry) -> tuple:
+        # Old configs stored just the discord user id
+        if not isinstance(entry, dict):
+            entry = {'discord_id': entry}
+        return (guild_id, account_name, *(entry.get(key) for key in ACCOUNT_KEYS))
+
+    @staticmethod
+    def _config(row, accounts) -> dict:
+        config = json.loads(row[4])
+        config.update(zip(GUILD_KEYS, row[1:4]))
+        config['bnet_accounts'] = accounts
+        return config
+
+    def _accounts(self, guild_id) -> dict:
+        rows = self.db.execute(
+            f"SELECT account_name, {', '.join(ACCOUNT_KEYS)} FROM accounts WHERE guild_id = ?",
+            (guild_id,)
+        )
+        return {row[0]: dict(zip(ACCOUNT_KEYS, row[1:])) for row in rows}
+
+    def load(self, guild_id: str) -> dict:
+        """Returns a server's config, or None if it has never been saved"""
+        row = self.db.execute(
+            f"SELECT guild_id, {', '.join(GUILD_KEYS)}, extra FROM guilds WHERE guild_id = ?",
+            (guild_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return self._config(row, self._accounts(guild_id))
+
+    def save(self, guild_id: str, config: dict):
+        """Saves a server's config and its accounts in a single transaction"""
+        extra = {key: value for key, value in config.items() if key not in GUILD_KEYS and key != 'bnet_accounts'}
+        accounts = config.get('bnet_accounts', {})
+
+        with self.transaction():
+            self.db.execute(
+                "INSERT OR REPLACE INTO guilds VALUES (?, ?, ?, ?, ?)",
+                (guild_id, *(config.get(key) for key in GUILD_KEYS), json.dumps(extra))
+            )
+            self.db.execute("DELETE FROM accounts WHERE guild_id = ?", (guild_id,))
+            self.db.executemany(
+                "INSERT INTO accounts VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self._account_row(guild_id, name, entry) for name, entry in accounts.items())
+            )
+
+    def save_accounts(self, guild_id: str, accounts: dict, cursor: tuple = None):
+        """
+        Adds or updates some of a server's accounts in a single transaction, leaving the rest untouched.
+        If given a (channel_id, message_id) cursor, it is saved in the same transaction,
+        so messages are never marked as scanned without the accounts found in them
+        """
+        with self.transaction():
+            self.db.executemany(
+                "INSERT OR REPLACE INTO accounts VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self._account_row(guild_id, name, entry) for name, entry in accounts.items())
+            )
+            if cursor is not None:
+                # Cursors only ever move forward, whether set by a scan or a live message
+                self.db.execute(
+                    "INSERT INTO scan_cursors VALUES (?, ?, ?) "
+                    "ON CONFLICT (channel_id) DO UPDATE SET message_id = MAX(message_id, excluded.message_id)",
+                    (cursor[0], guild_id, cursor[1])
+                )
+
+    def scan_channels(self) -> dict:
+        """Returns {channel_id: guild_id} for every server with a scan channel"""
+        rows = self.db.execute("SELECT scan_channel, guild_id FROM guilds WHERE scan_channel IS NOT NULL")
+        return dict(rows.fetchall())
+
+    def get_cursor(self, channel_id: int) -> int:
+        """Returns the id of the last message scanned in a channel, or None if it was never scanned"""
+        row = self.db.execute("SELECT message_id FROM scan_cursors WHERE channel_id = ?", (channel_id,)).fetchone()
+        return row[0] if row else None
+
+    def iter_servers(self):
+        """Yields (guild_id, config) for every server, using one query per table"""
+        accounts = dict()
+        rows = self.db.execute(f"SELECT guild_id, account_name, {', '.join(ACCOUNT_KEYS)} FROM accounts")
+        for row in rows:
+            accounts.setdefault(row[0], dict())[row[1]] = dict(zip(ACCOUNT_KEYS, row[2:]))
+
+        rows = self.db.execute(f"SELECT guild_id, {', '.join(GUILD_KEYS)}, extra FROM guilds").fetchall()
+        for row in rows:
+            yield row[0], self._config(row, accounts.get(row[0], dict()))
+
+    def transaction(self):
+        return Transaction(self.db)
+
+    def migrate_json_dir(self, directory: str) -> int:
+        """
+        One-shot import of the old server_configs/<guild>.json files.
+        The directory is renamed afterwards so it isn't imported again. Returns the number of servers imported
+        """
+        migrated = 0
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json'):
+                continue
+
+            with open(os.path.join(directory, filename), 'r') as f:
+                config = json.load(f)
+            self.save(filename[:-5], config)
+            migrated += 1
+
+        os.rename(directory, directory.rstrip('/\\') + '.migrated')
+        return migrated
+
+class Transaction:
+    """Context manager wrapping BEGIN / COMMIT / ROLLBACK on an autocommit connection"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
@@ -0,0 +1,28 @@
+from functools import lru_cache
+import datetime
+import dateutil.parser
+
+# Returned for anything that can't be parsed, so it sorts before every real date
+DATE_MIN = datetime.datetime(year=1, month=1, day=1, tzinfo=datetime.timezone.utc)
+
+@lru_cache(maxsize=65536)
+def _parse(date_str: str) -> datetime.datetime:
+    # SC2Pulse always sends ISO-8601 (e.g. 2025-03-20T12:34:56.789Z), which fromisoformat handles directly
+    # Older Pythons don't accept the Z suffix or odd fraction lengths, so dateutil remains as a fallback
+    try:
+        if date_str.endswith('Z'):
+            return datetime.datetime.fromisoformat(date_str[:-1] + '+00:00')
+        return datetime.datetime.fromisoformat(date_str)
+    except ValueError:
+        pass
+
+    try:
+        return dateutil.parser.parse(date_str)
+    except (ValueError, OverflowError):
+        return DATE_MIN
+
+def safe_dateparse(date_str: str) -> datetime.datetime:
+    """Parses a timestamp from SC2Pulse. Never raises: returns DATE_MIN for missing or malformed dates"""
+    if not isinstance(date_str, str):
+        return DATE_MIN
+    return _parse(date_str)